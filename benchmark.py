@@ -0,0 +1,454 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+WebsiteScraperのオフラインベンチマーク
+
+ローカルにWordPress風の合成サイト（サイトマップインデックス、子サイトマップ、
+カテゴリー・ページネーション付きのHTMLサイトマップ、記事ページ）を立ち上げ、
+WebsiteScraperをエンドツーエンドで実行してスループットなどを計測する。
+"""
+
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from bs4 import BeautifulSoup
+
+from scraper import WebsiteScraper
+
+CATEGORIES = ['news', 'tech', 'life', 'travel', 'food', 'review', 'howto', 'column']
+URLS_PER_SITEMAP = 1000
+ARTICLES_PER_LISTING = 10
+
+WORDS = ('スクレイピング データ 記事 サイト 更新 公開 解析 変換 設定 確認 '
+         'lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor').split()
+
+
+def _sentence(rng, words=12):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)) + '。'
+
+
+class SyntheticSite:
+    """記事番号から決定的にページを生成する合成サイト"""
+
+    def __init__(self, articles, base_url=''):
+        self.articles = articles
+        self.base_url = base_url
+
+    def article_path(self, i):
+        return f"/{2020 + i % 5}/{i % 12 + 1:02d}/article-{i}/"
+
+    def category_of(self, i):
+        return CATEGORIES[i % len(CATEGORIES)]
+
+    def lastmod(self, i):
+        return f"{2020 + i % 5}-{i % 12 + 1:02d}-{i % 28 + 1:02d}"
+
+    def robots(self):
+        return f"User-agent: *\nDisallow: /wp-admin/\nSitemap: {self.base_url}/sitemap_index.xml\n"
+
+    def sitemap_index(self):
+        count = (self.articles + URLS_PER_SITEMAP - 1) // URLS_PER_SITEMAP
+        items = ''.join(
+            f"<sitemap><loc>{self.base_url}/post-sitemap{n + 1}.xml</loc></sitemap>" for n in range(count)
+        )
+        return ('<?xml version="1.0" encoding="UTF-8"?>'
+                f'<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{items}</sitemapindex>')
+
+    def child_sitemap(self, n):
+        start = (n - 1) * URLS_PER_SITEMAP
+        end = min(start + URLS_PER_SITEMAP, self.articles)
+        if start < 0 or start >= end:
+            return None
+        items = ''.join(
+            f"<url><loc>{self.base_url}{self.article_path(i)}</loc><lastmod>{self.lastmod(i)}</lastmod></url>"
+            for i in range(start, end)
+        )
+        return ('<?xml version="1.0" encoding="UTF-8"?>'
+                f'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{items}</urlset>')
+
+    def _layout(self, title, body):
+        nav = ''.join(f'<li><a href="/category/{c}/">{c}</a></li>' for c in CATEGORIES)
+        return (
+            '<!DOCTYPE html><html lang="ja"><head><meta charset="utf-8">'
+            f'<title>{title}</title>{body[0]}'
+            '<link rel="stylesheet" href="/wp-content/themes/theme/style.css">'
+            '<script>window.dataLayer = window.dataLayer || [];</script></head><body>'
+            f'<header class="site-header"><a href="/">Synthetic Blog</a><nav><ul>{nav}</ul></nav></header>'
+            f'<div id="content" class="site-content"><main id="main">{body[1]}</main>'
+            f'<aside class="sidebar"><div class="widget"><h3>カテゴリー</h3><ul>{nav}</ul></div>'
+            '<div class="advertisement">AD</div></aside></div>'
+            '<footer class="site-footer"><p>&copy; Synthetic Blog</p></footer>'
+            '<script src="/wp-includes/js/wp-embed.min.js"></script></body></html>'
+        )
+
+    def article(self, i):
+        if not 0 <= i < self.articles:
+            return None
+        rng = random.Random(i)
+        title = f"記事 {i}: {_sentence(rng, 4)}"
+        sections = []
+        for s in range(rng.randint(3, 6)):
+            paragraphs = ''.join(
+                f"<p>{_sentence(rng)} <strong>{rng.choice(WORDS)}</strong> "
+                f"<a href=\"{self.article_path(rng.randrange(self.articles))}\">{rng.choice(WORDS)}</a> "
+                f"{_sentence(rng)}</p>"
+                for _ in range(rng.randint(2, 5))
+            )
+            extra = ''
+            if s == 1:
+                extra = '<ul>' + ''.join(f"<li>{_sentence(rng, 5)}</li>" for _ in range(4)) + '</ul>'
+            elif s == 2:
+                rows = ''.join(f"<tr><td>{r}</td><td>{rng.choice(WORDS)}</td><td>{rng.randint(1, 999)}</td></tr>"
+                               for r in range(5))
+                extra = f"<table><thead><tr><th>#</th><th>項目</th><th>値</th></tr></thead><tbody>{rows}</tbody></table>"
+            elif s == 3:
+                extra = f"<pre><code>for i in range({i}):\n    print(i &lt; 10)</code></pre>"
+            sections.append(f"<h2>{_sentence(rng, 3)}</h2>{paragraphs}{extra}"
+                            f"<img src=\"/wp-content/uploads/{i}-{s}.jpg\" alt=\"\">")
+        head = f'<meta property="article:published_time" content="{self.lastmod(i)}T09:00:00+09:00">'
+        body = (
+            f'<article class="post"><h1 class="entry-title">{title}</h1>'
+            f'<time datetime="{self.lastmod(i)}T09:00:00+09:00">{self.lastmod(i)}</time>'
+            f'<div class="entry-content">{"".join(sections)}'
+            '<div class="wp-block-social-links"><a href="https://example.com/share">share</a></div>'
+            '</div></article>'
+        )
+        return self._layout(title, (head, body))
+
+    def html_sitemap(self):
+        links = ''.join(f'<li><a href="/category/{c}/">{c}</a></li>' for c in CATEGORIES)
+        return self._layout('サイトマップ', ('', f'<h1>サイトマップ</h1><ul>{links}</ul>'))
+
+    def listing(self, category, page):
+        if category not in CATEGORIES:
+            return None
+        members = range(CATEGORIES.index(category), self.articles, len(CATEGORIES))
+        pages = max(1, (len(members) + ARTICLES_PER_LISTING - 1) // ARTICLES_PER_LISTING)
+        if not 1 <= page <= pages:
+            return None
+        chunk = members[(page - 1) * ARTICLES_PER_LISTING:page * ARTICLES_PER_LISTING]
+        items = ''.join(f'<li><a href="{self.article_path(i)}">記事 {i}</a></li>' for i in chunk)
+        # WordPressと同様に前後数ページと最終ページへのリンクを出す
+        numbers = sorted({1, pages, *range(max(1, page - 2), min(pages, page + 2) + 1)})
+        pager = ''.join(f'<a href="/category/{category}/page/{n}/">{n}</a>' for n in numbers if n != page)
+        return self._layout(f'{category} - {page}', ('', f'<ul class="posts">{items}</ul><nav class="pager">{pager}</nav>'))
+
+    def render(self, path):
+        """パスに対応する (本文, Content-Type) を返す（存在しなければNone）"""
+        path = path.split('?', 1)[0].split('#', 1)[0]
+        parts = [p for p in path.split('/') if p]
+        if path == '/robots.txt':
+            return self.robots(), 'text/plain'
+        if path == '/sitemap_index.xml':
+            return self.sitemap_index(), 'application/xml'
+        if len(parts) == 1 and parts[0].startswith('post-sitemap') and parts[0].endswith('.xml'):
+            number = parts[0][len('post-sitemap'):-len('.xml')]
+            body = self.child_sitemap(int(number)) if number.isdigit() else None
+            return (body, 'application/xml') if body else None
+        if parts == ['html-sitemap']:
+            return self.html_sitemap(), 'text/html; charset=utf-8'
+        if len(parts) in (2, 4) and parts[0] == 'category':
+            page = 1
+            if len(parts) == 4:
+                if parts[2] != 'page' or not parts[3].isdigit():
+                    return None
+                page = int(parts[3])
+            body = self.listing(parts[1], page)
+            return (body, 'text/html; charset=utf-8') if body else None
+        if len(parts) == 3 and parts[2].startswith('article-') and parts[2][8:].isdigit():
+            body = self.article(int(parts[2][8:]))
+            return (body, 'text/html; charset=utf-8') if body else None
+        return None
+
+
+def _make_handler(site, latency, jitter, error_rate, seed):
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+    last_modified = formatdate(usegmt=True)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # ヘッダーと本文は別々に書き込むため、Nagleアルゴリズムと遅延ACKで
+        # keep-aliveの応答ごとに数十ミリ秒待たされないようTCP_NODELAYを設定する
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            with rng_lock:
+                delay = max(0.0, latency + rng.uniform(-jitter, jitter))
+                fail = rng.random() < error_rate
+            if delay:
+                time.sleep(delay)
+            if fail:
+                self._send(503, b'', 'text/plain', {'Retry-After': '0'})
+                return
+            rendered = site.render(self.path)
+            if rendered is None:
+                self._send(404, b'not found', 'text/plain')
+                return
+            body = rendered[0].encode('utf-8')
+            etag = '"' + hashlib.md5(body).hexdigest() + '"'
+            if self.headers.get('If-None-Match') == etag:
+                self._send(304, b'', rendered[1], {'ETag': etag})
+                return
+            self._send(200, body, rendered[1], {'ETag': etag, 'Last-Modified': last_modified})
+
+        def _send(self, status, body, content_type, headers=None):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            if body and self.command != 'HEAD':
+                self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def _serve(port, articles, latency, jitter, error_rate, seed, ready):
+    """合成サイトのHTTPサーバーを起動する（計測に影響しないよう別プロセスで実行）"""
+    site = SyntheticSite(articles, base_url=f"http://127.0.0.1:{port}")
+    server = ThreadingHTTPServer(('127.0.0.1', port), _make_handler(site, latency, jitter, error_rate, seed))
+    server.daemon_threads = True
+    ready.set()
+    server.serve_forever()
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class BenchmarkScraper(WebsiteScraper):
+    """ページごとの取得開始から保存までの時間を記録するスクレイパー"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._started = {}
+        self.latencies = []
+
+    def fetch_content(self, url, archive=False):
+        self._started.setdefault(url, time.perf_counter())
+        return super().fetch_content(url, archive=archive)
+
+    def _save_page(self, page_info):
+        result = super()._save_page(page_info)
+        started = self._started.pop(page_info['url'], None)
+        if started is not None:
+            self.latencies.append(time.perf_counter() - started)
+        return result
+
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(q / 100.0 * (len(values) - 1)))))
+    return values[index]
+
+
+def _peak_rss_mb():
+    """メインプロセスの最大常駐メモリ(MB)を返す"""
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024  # macOSはバイト、Linuxはキロバイト
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def run_end_to_end(base_url, args):
+    """WebsiteScraperをエンドツーエンドで実行して計測結果を返す"""
+    output_dir = tempfile.mkdtemp(prefix='scraper-bench-')
+    sitemap_url = f"{base_url}/html-sitemap/" if args.html_sitemap else None
+    scraper = BenchmarkScraper(
+        base_url=base_url + '/',
+        output_dir=output_dir,
+        delay=0,
+        sitemap_url=sitemap_url,
+        concurrency=args.concurrency,
+        rate=args.rate,
+        max_retries=args.retries,
+        cache_dir=args.cache_dir,
+        markdown_engine=args.markdown_engine,
+        parser=args.parser,
+        workers=args.workers,
+        output_format=args.output_format,
+        max_depth=args.max_depth,
+        adaptive=args.adaptive,
+    )
+    times_before = os.times()
+    started = time.perf_counter()
+    log = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(log if args.quiet else sys.stdout):
+            scraper.run(max_pages=args.max_pages)
+    finally:
+        elapsed = time.perf_counter() - started
+        times_after = os.times()
+        if not args.keep_output:
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+    pages = len(scraper.latencies)
+    # 解析ワーカーはforkserverから起動されメインプロセスの子にならないため、
+    # ワーカーが計測して送ったCPU時間と最大常駐メモリを使う
+    summary = scraper.metrics.summary()
+    counters = summary['counters']
+    worker_rss = summary['gauges'].get('workers.max_rss_kb', {}).get('max', 0)
+    return {
+        'pages': pages,
+        'elapsed_sec': round(elapsed, 3),
+        'pages_per_sec': round(pages / elapsed, 2) if elapsed else 0.0,
+        'latency_p50_ms': round(_percentile(scraper.latencies, 50) * 1000, 1),
+        'latency_p99_ms': round(_percentile(scraper.latencies, 99) * 1000, 1),
+        'cpu_user_sec': round(times_after.user - times_before.user, 2),
+        'cpu_system_sec': round(times_after.system - times_before.system, 2),
+        'cpu_workers_sec': round((counters.get('workers.cpu_user_ms', 0)
+                                  + counters.get('workers.cpu_system_ms', 0)) / 1000, 2),
+        'peak_rss_mb': round(_peak_rss_mb(), 1),
+        'peak_rss_workers_mb': round(worker_rss / 1024, 1),
+        'http': scraper.transport.stats(),
+        'hosts': scraper.rate_limiter.report(),
+        'stages': {name: {key: stage[key] for key in ('count', 'mean_ms', 'p50_ms', 'p99_ms', 'total_ms')}
+                   for name, stage in summary['stages'].items()},
+        'output_dir': output_dir if args.keep_output else None,
+    }
+
+
+def run_micro(base_url, args):
+    """get_soup・extract_content・html_to_markdownの1回あたりの処理時間を計測する"""
+    site = SyntheticSite(args.articles, base_url=base_url)
+    scraper = WebsiteScraper(base_url=base_url + '/', delay=0, markdown_engine=args.markdown_engine, parser=args.parser)
+    samples = min(args.micro_samples, args.articles)
+    html = [site.article(i).encode('utf-8') for i in range(samples)]
+    timings = {'get_soup': [], 'parse': [], 'extract_content': [], 'html_to_markdown': []}
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(samples):
+            started = time.perf_counter()
+            scraper.get_soup(base_url + site.article_path(i))
+            timings['get_soup'].append(time.perf_counter() - started)
+
+    for content in html:
+        started = time.perf_counter()
+        soup = BeautifulSoup(content, scraper.parser)
+        timings['parse'].append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        article = scraper.extract_content(soup)
+        timings['extract_content'].append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        scraper.html_to_markdown(article)
+        timings['html_to_markdown'].append(time.perf_counter() - started)
+
+    return {
+        name: {
+            'mean_ms': round(sum(values) / len(values) * 1000, 3) if values else 0.0,
+            'p50_ms': round(_percentile(values, 50) * 1000, 3),
+            'p99_ms': round(_percentile(values, 99) * 1000, 3),
+        }
+        for name, values in timings.items()
+    }
+
+
+def _print_report(result):
+    e2e = result.get('end_to_end')
+    if e2e:
+        print("\n=== エンドツーエンド ===")
+        print(f"処理ページ数      : {e2e['pages']}")
+        print(f"経過時間          : {e2e['elapsed_sec']} 秒")
+        print(f"スループット      : {e2e['pages_per_sec']} pages/sec")
+        print(f"ページ処理時間    : p50 {e2e['latency_p50_ms']} ms / p99 {e2e['latency_p99_ms']} ms")
+        print(f"CPU時間           : user {e2e['cpu_user_sec']} 秒 / system {e2e['cpu_system_sec']} 秒 / "
+              f"解析ワーカー {e2e['cpu_workers_sec']} 秒")
+        print(f"最大常駐メモリ    : {e2e['peak_rss_mb']} MB（解析ワーカー1つあたり最大 {e2e['peak_rss_workers_mb']} MB）")
+        http = e2e['http']
+        print(f"HTTP              : リクエスト {http['requests']} / 新規接続 {http['connections_opened']} / "
+              f"リトライ {http['retries']}")
+        for host, report in e2e['hosts'].items():
+            if 'concurrency' in report:
+                print(f"同時リクエスト数  : {host} 最終 {report['concurrency']} / 最大 {report['peak_concurrency']} / "
+                      f"減速 {report['decreases']}回")
+        for name, stage in e2e['stages'].items():
+            print(f"  {name:<16}: 平均 {stage['mean_ms']} ms / p99 {stage['p99_ms']} ms / 合計 {stage['total_ms']} ms")
+    micro = result.get('micro')
+    if micro:
+        print("\n=== 関数ごとの処理時間 ===")
+        for name, stats in micro.items():
+            print(f"{name:<18}: 平均 {stats['mean_ms']} ms / p50 {stats['p50_ms']} ms / p99 {stats['p99_ms']} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ローカルの合成サイトでWebsiteScraperのベンチマークを実行する')
+    parser.add_argument('--articles', type=int, default=10000, help='合成サイトの記事数（デフォルト: 10000）')
+    parser.add_argument('--latency', type=float, default=0.0, help='サーバーの応答遅延ミリ秒（デフォルト: 0）')
+    parser.add_argument('--jitter', type=float, default=0.0, help='応答遅延のゆらぎミリ秒（デフォルト: 0）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='503を返す割合 0〜1（デフォルト: 0）')
+    parser.add_argument('--seed', type=int, default=0, help='遅延・エラー注入の乱数シード（デフォルト: 0）')
+    parser.add_argument('--html-sitemap', action='store_true', help='XMLではなくHTMLサイトマップから記事を列挙する')
+    parser.add_argument('--max-pages', type=int, help='処理する最大ページ数（デフォルト: 全記事）')
+    parser.add_argument('--concurrency', type=int, default=1, help='同時リクエスト数（デフォルト: 1）')
+    parser.add_argument('--rate', type=float, help='ホストあたりの最大リクエスト数/秒（デフォルト: 無制限）')
+    parser.add_argument('--retries', type=int, default=3, help='最大リトライ回数（デフォルト: 3）')
+    parser.add_argument('--workers', type=int, default=0, help='解析プロセス数（デフォルト: 0）')
+    parser.add_argument('--adaptive', action='store_true', help='同時リクエスト数を自動調整する')
+    parser.add_argument('--markdown-engine', choices=['html2text', 'dom'], default='html2text')
+    parser.add_argument('--parser', choices=['html.parser', 'lxml'], default='html.parser')
+    parser.add_argument('--output-format', choices=['markdown', 'jsonl', 'shards'], default='markdown')
+    parser.add_argument('--max-depth', type=int, default=2)
+    parser.add_argument('--cache-dir', help='HTTPキャッシュの保存先（指定時のみ有効）')
+    parser.add_argument('--micro-samples', type=int, default=200, help='関数ごとの計測に使う記事数（デフォルト: 200）')
+    parser.add_argument('--skip-e2e', action='store_true', help='エンドツーエンドの計測を省略する')
+    parser.add_argument('--skip-micro', action='store_true', help='関数ごとの計測を省略する')
+    parser.add_argument('--keep-output', action='store_true', help='出力ディレクトリを削除せずに残す')
+    parser.add_argument('--verbose', dest='quiet', action='store_false', help='スクレイパーのログを表示する')
+    parser.add_argument('--json', help='計測結果をJSONで保存するパス')
+    args = parser.parse_args()
+
+    port = _free_port()
+    ready = multiprocessing.Event()
+    server = multiprocessing.Process(
+        target=_serve,
+        args=(port, args.articles, args.latency / 1000.0, args.jitter / 1000.0, args.error_rate, args.seed, ready),
+        daemon=True,
+    )
+    server.start()
+    ready.wait(10)
+    base_url = f"http://127.0.0.1:{port}"
+    print(f"合成サイトを起動しました: {base_url}（記事数 {args.articles}）")
+
+    result = {'config': {k: v for k, v in vars(args).items() if k != 'json'}}
+    try:
+        if not args.skip_micro:
+            result['micro'] = run_micro(base_url, args)
+        if not args.skip_e2e:
+            result['end_to_end'] = run_end_to_end(base_url, args)
+    finally:
+        server.terminate()
+        server.join()
+
+    _print_report(result)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\n計測結果を保存しました: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,498 +1,3111 @@
-#!/usr/bin/env python3
-# -*- coding: utf-8 -*-
-
-import requests
-from bs4 import BeautifulSoup
-import re
-import time
-import os
-import json
-import argparse
-import xml.etree.ElementTree as ET
-from urllib.parse import urljoin, urlparse
-from pathlib import Path
-import html2text
-
-class WebsiteScraper:
-    def __init__(self, base_url, output_dir="scraped_articles", delay=1, sitemap_url=None, try_wordpress_sitemaps=False):
-        self.base_url = base_url
-        self.visited_urls = set()
-        self.all_pages = []
-        self.user_agent = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        self.headers = {'User-Agent': self.user_agent}
-        self.output_dir = Path(output_dir)
-        self.delay = delay
-        self.sitemap_url = sitemap_url
-        self.try_wordpress_sitemaps = try_wordpress_sitemaps
-        
-        # html2textコンバーターの設定
-        self.h2t = html2text.HTML2Text()
-        self.h2t.ignore_links = False
-        self.h2t.ignore_images = True
-        self.h2t.body_width = 0  # 自動折り返しなし
-        self.h2t.unicode_snob = True  # Unicode文字を保持
-        self.h2t.bypass_tables = False  # テーブルを保持
-        self.h2t.mark_code = True  # コードブロックをマークダウン形式で保持
-        
-    def get_soup(self, url):
-        """URLからHTMLを取得してBeautifulSoupオブジェクトを返す"""
-        try:
-            response = requests.get(url, headers=self.headers)
-            response.raise_for_status()  # エラーチェック
-            return BeautifulSoup(response.content, 'html.parser')
-        except Exception as e:
-            print(f"Error fetching {url}: {e}")
-            return None
-    
-    def extract_content(self, soup):
-        """記事の本文コンテンツを抽出する"""
-        if soup is None:
-            return None
-            
-        # ヘッダー、フッター、サイドバー、広告などの不要要素を削除
-        for elem in soup.select('header, footer, nav, aside, .sidebar, .advertisement, script, style, .widget, .wp-block-social-links'):
-            if elem:
-                elem.decompose()
-        
-        # 記事の本文を取得（サイトの構造によって調整が必要）
-        article = soup.select_one('article, .entry-content, .post-content, main')
-        
-        if not article:
-            # 記事要素が見つからない場合はmain要素を探す
-            article = soup.select_one('main, .main, #main, #content')
-            
-        if not article:
-            # それでも見つからない場合はbody要素を使用
-            article = soup.body
-            
-        return article
-    
-    def html_to_markdown(self, html_content):
-        """HTMLコンテンツをMarkdownに変換する"""
-        if html_content is None:
-            return ""
-        
-        # BeautifulSoupオブジェクトをHTML文字列に変換
-        if isinstance(html_content, BeautifulSoup) or hasattr(html_content, 'prettify'):
-            html_string = str(html_content)
-        else:
-            html_string = str(html_content)
-            
-        # html2textを使ってMarkdownに変換
-        return self.h2t.handle(html_string)
-    
-    def extract_links(self, soup, current_url):
-        """ページ内のリンクを抽出する"""
-        if soup is None:
-            return []
-            
-        links = []
-        for a_tag in soup.find_all('a', href=True):
-            href = a_tag['href']
-            # 相対URLを絶対URLに変換
-            absolute_url = urljoin(current_url, href)
-            
-            # 同じドメイン内のURLのみを収集
-            if self.base_url in absolute_url and '#' not in absolute_url:
-                links.append(absolute_url)
-                
-        return links
-    
-    def sanitize_filename(self, title):
-        """ファイル名に使用できない文字を置換する"""
-        # 無効な文字を削除または置換
-        filename = re.sub(r'[\\/*?:"<>|]', "", title)
-        # スペースをアンダースコアに置換
-        filename = filename.replace(' ', '_')
-        # 長すぎる場合は切り詰める
-        if len(filename) > 100:
-            filename = filename[:100]
-        return filename
-    
-    def save_to_markdown(self, page):
-        """ページ情報をMarkdownファイルとして保存する"""
-        # 出力ディレクトリが存在しない場合は作成
-        if not self.output_dir.exists():
-            self.output_dir.mkdir(parents=True)
-            
-        title = page.get('title', 'No Title')
-        url = page.get('url', '')
-        content = page.get('content', '')
-        date = page.get('date', '')
-        
-        # URLからスラッグを抽出してファイル名に使用
-        parsed_url = urlparse(url)
-        path_parts = parsed_url.path.strip('/').split('/')
-        slug = path_parts[-1] if path_parts else 'index'
-        
-        # ファイル名を生成（スラッグがない場合はタイトルを使用）
-        if slug == 'index' or not slug:
-            filename = self.sanitize_filename(title)
-        else:
-            filename = self.sanitize_filename(slug)
-            
-        filepath = self.output_dir / f"{filename}.md"
-        
-        # ファイルに書き込む
-        with open(filepath, 'w', encoding='utf-8') as f:
-            # メタデータ部分を書き込み
-            f.write(f"---\n")
-            f.write(f"title: {title}\n")
-            f.write(f"url: {url}\n")
-            if date:
-                f.write(f"date: {date}\n")
-            f.write(f"---\n\n")
-            
-            # 本文を書き込み
-            f.write(content)
-            
-        return filepath
-    
-    def extract_date(self, soup):
-        """記事の公開日を抽出する"""
-        if soup is None:
-            return ""
-            
-        # まずmetaタグから日付を探す
-        meta_date = soup.select_one('meta[property="article:published_time"]')
-        if meta_date and meta_date.get('content'):
-            return meta_date['content'].split('T')[0]  # ISOフォーマットの日付部分のみ
-            
-        # time要素から日付を探す
-        time_elem = soup.select_one('time')
-        if time_elem and time_elem.get('datetime'):
-            return time_elem['datetime'].split('T')[0]
-            
-        # 日付らしきクラス名を持つ要素を探す
-        date_classes = ['date', 'published', 'post-date', 'entry-date']
-        for cls in date_classes:
-            date_elem = soup.select_one(f'.{cls}')
-            if date_elem:
-                return date_elem.text.strip()
-                
-        return ""
-    
-    def process_page(self, url):
-        """指定されたURLのページを処理する"""
-        if url in self.visited_urls:
-            return
-            
-        print(f"Processing: {url}")
-        self.visited_urls.add(url)
-        
-        soup = self.get_soup(url)
-        if soup:
-            # タイトルを取得
-            title = soup.title.string if soup.title else "No Title"
-            # 日付を抽出
-            date = self.extract_date(soup)
-            # 本文コンテンツを抽出
-            article_content = self.extract_content(soup)
-            # HTMLをMarkdownに変換
-            markdown_content = self.html_to_markdown(article_content)
-            
-            page_info = {
-                'url': url,
-                'title': title,
-                'date': date,
-                'content': markdown_content
-            }
-            
-            self.all_pages.append(page_info)
-            return page_info
-        
-        return None
-        
-    def parse_xml_sitemap(self, sitemap_url, xml_content):
-        """XMLサイトマップを解析してURLのリストを返す"""
-        all_urls = []
-        
-        try:
-            # XMLをパース
-            root = ET.fromstring(xml_content)
-            
-            # 名前空間を取得
-            ns = {'sm': 'http://www.sitemaps.org/schemas/sitemap/0.9'}
-            
-            # サイトマップインデックスかどうかを確認
-            if root.tag.endswith('sitemapindex'):
-                print("サイトマップインデックスを検出しました。含まれるサイトマップを処理します。")
-                # サイトマップインデックスの場合、各サイトマップを処理
-                for sitemap in root.findall('.//sm:sitemap', ns):
-                    loc = sitemap.find('sm:loc', ns)
-                    if loc is not None and loc.text:
-                        print(f"サブサイトマップを処理: {loc.text}")
-                        try:
-                            sub_response = requests.get(loc.text, headers=self.headers)
-                            sub_urls = self.parse_xml_sitemap(loc.text, sub_response.content)
-                            all_urls.extend(sub_urls)
-                            time.sleep(self.delay)  # サーバー負荷軽減
-                        except Exception as e:
-                            print(f"サブサイトマップの処理中にエラー: {e}")
-            else:
-                # 通常のサイトマップの場合、各URLを処理
-                for url in root.findall('.//sm:url', ns):
-                    loc = url.find('sm:loc', ns)
-                    if loc is not None and loc.text:
-                        if self.base_url in loc.text:
-                            all_urls.append(loc.text)
-                
-                print(f"XMLサイトマップから {len(all_urls)} 個のURLを抽出しました")
-        
-        except ET.ParseError as e:
-            print(f"XMLの解析エラー: {e}、HTMLサイトマップとして処理を試みます")
-            soup = self.get_soup(sitemap_url)
-            if soup:
-                # HTMLサイトマップとして処理
-                html_urls = self.parse_html_sitemap(soup, sitemap_url)
-                return html_urls
-        
-        return all_urls
-        
-    def parse_html_sitemap(self, soup, current_url):
-        """HTMLサイトマップを解析してリンクを抽出する"""
-        # サイトマップから直接リンクを取得
-        links = self.extract_links(soup, current_url)
-        
-        # カテゴリーページのリンクを分離
-        category_links = [link for link in links if 'category' in link]
-        # 記事ページのリンクを分離（カテゴリではなく、ページネーションでもない）
-        article_links = [link for link in links if 'category' not in link and '/page-' not in link and '/page/' not in link]
-        
-        # 各カテゴリーページから記事リンクを取得
-        all_article_links = set(article_links)
-        for cat_link in category_links:
-            print(f"カテゴリーページから記事リンクを取得中: {cat_link}")
-            cat_soup = self.get_soup(cat_link)
-            if cat_soup:
-                # カテゴリページ内の全リンクを取得
-                cat_links = self.extract_links(cat_soup, cat_link)
-                # カテゴリページ内のページネーションリンクを取得
-                pagination_links = [link for link in cat_links if '/page/' in link]
-                
-                # 現在のカテゴリページから記事リンクを抽出
-                cat_article_links = [link for link in cat_links 
-                                    if 'category' not in link 
-                                    and '/page/' not in link 
-                                    and link not in all_article_links
-                                    and self.base_url in link]
-                all_article_links.update(cat_article_links)
-                
-                # ページネーションをたどって記事を取得
-                for page_link in pagination_links:
-                    print(f"ページネーションをたどっています: {page_link}")
-                    page_soup = self.get_soup(page_link)
-                    if page_soup:
-                        page_links = self.extract_links(page_soup, page_link)
-                        page_article_links = [link for link in page_links 
-                                            if 'category' not in link 
-                                            and '/page/' not in link 
-                                            and link not in all_article_links
-                                            and self.base_url in link]
-                        all_article_links.update(page_article_links)
-                        time.sleep(self.delay)
-                
-                time.sleep(self.delay)
-        
-        # メインページから記事が抽出できなかった場合
-        if not all_article_links:
-            # 別のアプローチを試す（記事を含む要素を特定）
-            # たとえばaタグで特定のCSSクラスを持つものなど
-            if soup:
-                # 記事リンクのパターンを持つaタグを探す
-                article_pattern = rf'{self.base_url}[^/]+/[^/]+/'
-                article_a_tags = soup.find_all('a', href=re.compile(article_pattern))
-                for a_tag in article_a_tags:
-                    if a_tag.get('href'):
-                        all_article_links.add(a_tag['href'])
-        
-        return list(all_article_links)
-    
-    def get_sitemap_links(self):
-        """サイトマップからリンクを取得する"""
-        # take1bit.comの場合は特定のページをサイトマップとして扱う
-        if 'take1bit.com' in self.base_url and not self.sitemap_url:
-            # WordPressのサイトマップパターンを試す
-            sitemap_candidates = [
-                urljoin(self.base_url, "sitemap.xml"),
-                urljoin(self.base_url, "sitemap_index.xml"),
-                urljoin(self.base_url, "post-sitemap.xml"),
-                urljoin(self.base_url, "page-sitemap.xml"),
-                "https://take1bit.com/page-448/"  # 最後にフォールバックとして特定ページを試す
-            ]
-            
-            # 候補となるサイトマップを順番に試す
-            for candidate in sitemap_candidates:
-                print(f"サイトマップ候補を確認中: {candidate}")
-                try:
-                    response = requests.get(candidate, headers=self.headers)
-                    if response.status_code == 200:
-                        sitemap_url = candidate
-                        print(f"有効なサイトマップが見つかりました: {sitemap_url}")
-                        content_type = response.headers.get('Content-Type', '')
-                        if 'xml' in content_type.lower() or sitemap_url.endswith('.xml'):
-                            print("XMLサイトマップとして処理します")
-                            return self.parse_xml_sitemap(sitemap_url, response.content)
-                        else:
-                            print("HTMLサイトマップとして処理します")
-                            soup = self.get_soup(sitemap_url)
-                            if soup:
-                                return self.parse_html_sitemap(soup, sitemap_url)
-                except Exception as e:
-                    print(f"サイトマップ候補の確認中にエラー: {e}")
-            
-            # フォールバック: 特定ページをHTMLサイトマップとして処理
-            print(f"XMLサイトマップが見つからないため、HTMLページをサイトマップとして使用します: {sitemap_candidates[-1]}")
-            sitemap_url = sitemap_candidates[-1]
-            soup = self.get_soup(sitemap_url)
-            if soup:
-                return self.parse_html_sitemap(soup, sitemap_url)
-            return []
-        else:
-            # 他のサイトの場合
-            sitemap_url = self.sitemap_url
-            
-            # サイトマップURLが指定されていない場合はWordPressの一般的なパターンを試す
-            if not sitemap_url:
-                sitemap_candidates = [
-                    urljoin(self.base_url, "sitemap.xml"),
-                    urljoin(self.base_url, "sitemap_index.xml"),
-                    urljoin(self.base_url, "post-sitemap.xml"),
-                ]
-                
-                for candidate in sitemap_candidates:
-                    print(f"サイトマップ候補を確認中: {candidate}")
-                    try:
-                        response = requests.get(candidate, headers=self.headers)
-                        if response.status_code == 200:
-                            sitemap_url = candidate
-                            print(f"有効なサイトマップが見つかりました: {sitemap_url}")
-                            break
-                    except Exception as e:
-                        print(f"サイトマップ候補の確認中にエラー: {e}")
-            
-            # サイトマップが見つからなかった場合
-            if not sitemap_url:
-                print("有効なサイトマップが見つかりませんでした。デフォルトのURLを使用します。")
-                sitemap_url = urljoin(self.base_url, "sitemap.xml")
-            
-            print(f"サイトマップから取得中: {sitemap_url}")
-            
-            try:
-                response = requests.get(sitemap_url, headers=self.headers)
-                content_type = response.headers.get('Content-Type', '')
-                
-                # XMLサイトマップの場合（content-typeにxmlが含まれている場合）
-                if 'xml' in content_type.lower() or sitemap_url.endswith('.xml'):
-                    print("XMLサイトマップを検出しました。XMLとして処理します。")
-                    return self.parse_xml_sitemap(sitemap_url, response.content)
-            except Exception as e:
-                print(f"XMLサイトマップの確認中にエラーが発生しました: {e}")
-            
-            # HTMLサイトマップとして処理（XMLではない場合）
-            soup = self.get_soup(sitemap_url)
-            if soup:
-                return self.parse_html_sitemap(soup, sitemap_url)
-            
-            return []
-
-    def run(self, max_pages=None):
-        """スクレイピングを実行する"""
-        # まずはサイトマップからリンクを取得
-        print("サイトマップからリンクを取得中...")
-        article_links = self.get_sitemap_links()
-        
-        # 記事リンクが見つからなかった場合、WordPressの他のサイトマップも試す
-        if len(article_links) == 0 and ('wordpress' in self.base_url.lower() or self.try_wordpress_sitemaps):
-            print("WordPressサイトマップを確認します...")
-            wordpress_sitemaps = [
-                urljoin(self.base_url, "post-sitemap.xml"),
-                urljoin(self.base_url, "page-sitemap.xml"),
-                urljoin(self.base_url, "category-sitemap.xml"),
-                urljoin(self.base_url, "tag-sitemap.xml")
-            ]
-            
-            for wp_sitemap in wordpress_sitemaps:
-                try:
-                    print(f"WordPressサイトマップを確認中: {wp_sitemap}")
-                    response = requests.get(wp_sitemap, headers=self.headers)
-                    if response.status_code == 200 and ('xml' in response.headers.get('Content-Type', '').lower() or wp_sitemap.endswith('.xml')):
-                        wp_links = self.parse_xml_sitemap(wp_sitemap, response.content)
-                        if wp_links:
-                            print(f"{wp_sitemap}から{len(wp_links)}個のリンクを取得しました")
-                            article_links.extend(wp_links)
-                except Exception as e:
-                    print(f"WordPressサイトマップの確認中にエラー: {e}")
-        
-        # 重複を除去
-        article_links = list(set(article_links))        
-        print(f"サイトマップから {len(article_links)} 個の記事リンクを取得しました")
-        
-        # 取得したリンクを表示（最大10件）
-        print("\n取得した記事リンク一覧（一部）:")
-        for i, link in enumerate(article_links[:10], 1):
-            print(f"{i}. {link}")
-        
-        # 処理対象のファイルを決定（既に存在するファイルは除外）
-        existing_files = set()
-        if self.output_dir.exists():
-            # 既存のmdファイルからURLを抽出
-            for md_file in self.output_dir.glob('*.md'):
-                try:
-                    with open(md_file, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                        url_match = re.search(r'url: (https?://[^\n]+)', content)
-                        if url_match:
-                            existing_files.add(url_match.group(1))
-                except Exception as e:
-                    print(f"既存ファイル {md_file} の読み込みエラー: {e}")
-        
-        # 未処理のリンクのみを抽出
-        links_to_process = [link for link in article_links if link not in existing_files]
-        
-        # 最大ページ数の制限がある場合
-        if max_pages is not None and max_pages > 0:
-            links_to_process = links_to_process[:max_pages]
-            
-        print(f"\n処理対象: {len(links_to_process)}個の記事（既存の{len(existing_files)}個は除外）")
-        
-        processed_count = 0
-        
-        for link in links_to_process:
-            page_info = self.process_page(link)
-            if page_info:
-                # Markdownファイルとして保存
-                filepath = self.save_to_markdown(page_info)
-                print(f"保存完了: {filepath}")
-                processed_count += 1
-                
-            time.sleep(self.delay)  # サーバー負荷軽減
-        
-        print(f"\nスクレイピング完了! {processed_count}個の記事を保存しました。")
-        print(f"記事ファイルは '{self.output_dir}' ディレクトリに保存されています。")
-
-
-def main():
-    parser = argparse.ArgumentParser(description='ウェブサイトの記事をスクレイピングしてMarkdownに変換')
-    parser.add_argument('--url', required=True, help='スクレイピング対象のベースURL')
-    parser.add_argument('--output-dir', default='scraped_articles', help='出力先ディレクトリ（デフォルト: scraped_articles）')
-    parser.add_argument('--delay', type=float, default=1, help='リクエスト間の遅延秒数（デフォルト: 1）')
-    parser.add_argument('--max-pages', type=int, help='最大取得ページ数（デフォルト: 無制限）')
-    parser.add_argument('--sitemap', help='サイトマップページのURL（省略可能）')
-    parser.add_argument('--wordpress', action='store_true', help='WordPressサイトマップを試行する（デフォルト: False）')
-    
-    args = parser.parse_args()
-    
-    scraper = WebsiteScraper(
-        base_url=args.url,
-        output_dir=args.output_dir, 
-        delay=args.delay,
-        sitemap_url=args.sitemap,
-        try_wordpress_sitemaps=args.wordpress
-    )
-    
-    scraper.run(max_pages=args.max_pages)
-
-
-if __name__ == "__main__":
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# requests・bs4・soupsieve・html2text（とrobots.txt・cProfileの解析モジュール）は読み込みに時間がかかるため、
+# 使う関数の中で読み込む（--help や --list-urls を速く起動するため）
+import re
+import time
+import os
+import json
+import hashlib
+import sqlite3
+import io
+import gzip
+import codecs
+import base64
+import uuid
+import itertools
+import functools
+import argparse
+import threading
+import socket
+import bisect
+import sys
+import multiprocessing.util
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait, as_completed
+from urllib.parse import urljoin, urlparse, urlsplit, urlunsplit
+from collections import deque, Counter
+from contextlib import contextmanager, redirect_stdout
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from pathlib import Path
+
+
+# 重複判定で無視するトラッキング用のクエリパラメータ（utm_で始まるものも除外する）
+TRACKING_PARAMS = {'fbclid', 'gclid', 'yclid', 'msclkid', 'mc_cid', 'mc_eid', '_ga', '_gl', 'igshid'}
+
+
+def canonicalize_url(url, scheme=None):
+    """URLを正規化する（スキーム・ホストの小文字化、既定ポート・フラグメント・トラッキングパラメータの除去）"""
+    parts = urlsplit(url.strip())
+    try:
+        port = parts.port
+    except ValueError:
+        return url
+    original_scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if port and not ((original_scheme == 'http' and port == 80) or (original_scheme == 'https' and port == 443)):
+        host = f"{host}:{port}"
+    # http/httpsの揺れは指定されたスキームに揃える
+    new_scheme = scheme if scheme and original_scheme in ('http', 'https') else original_scheme
+    query = '&'.join(
+        param for param in parts.query.split('&')
+        if param and not _is_tracking_param(param.split('=', 1)[0])
+    )
+    return urlunsplit((new_scheme, host, parts.path or '/', query, ''))
+
+
+def _is_tracking_param(name):
+    name = name.lower()
+    return name.startswith('utm_') or name in TRACKING_PARAMS
+
+
+def url_key(url):
+    """重複判定用のキーを返す（スキームと末尾のスラッシュの違いを無視する）"""
+    parts = urlsplit(canonicalize_url(url))
+    path = parts.path.rstrip('/') or '/'
+    return f"{parts.netloc}{path}?{parts.query}" if parts.query else f"{parts.netloc}{path}"
+
+
+class CrawlFrontier:
+    """正規化したURLで重複を除きながら、深さ制限付きの幅優先でページを巡回するためのキュー"""
+
+    def __init__(self, max_depth):
+        self.max_depth = max_depth
+        self.seen = set()
+        self.queue = deque()
+
+    def mark_seen(self, url):
+        """URLを訪問済みにする（初めてのURLならTrueを返す）"""
+        key = url_key(url)
+        if key in self.seen:
+            return False
+        self.seen.add(key)
+        return True
+
+    def add(self, url, depth):
+        """未訪問のURLをキューに追加する（深さ制限を超える場合は追加しない）"""
+        if depth > self.max_depth or not self.mark_seen(url):
+            return False
+        self.queue.append((url, depth))
+        return True
+
+    def pop(self):
+        """キューの先頭のURLを取り出して (URL, 深さ) を返す"""
+        return self.queue.popleft()
+
+
+class HostRateLimiter:
+    """ホストごとのトークンバケットでリクエスト頻度を制限する（robots.txtのCrawl-delayも上限として守る）"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate  # 1秒あたりに補充されるトークン数（Noneまたは0なら無制限）
+        self.burst = max(1, burst)  # バケットの容量
+        self._buckets = {}  # ホスト -> (残りトークン数, 最終更新時刻)
+        self._crawl_delays = {}  # ホスト -> robots.txtのCrawl-delay秒
+        self._completed = {}  # ホスト -> [完了件数, 最初の開始時刻, 最後の完了時刻]
+        self._lock = threading.Lock()
+
+    def _host(self, url):
+        return urlparse(url).netloc.lower()
+
+    def set_crawl_delay(self, url, seconds):
+        """URLのホストへのリクエスト間隔の下限を設定する"""
+        if seconds and seconds > 0:
+            with self._lock:
+                self._crawl_delays[self._host(url)] = float(seconds)
+
+    def _limits(self, host):
+        """ホストに適用する (トークン補充速度, バケット容量) を返す"""
+        rate, burst = self.rate, self.burst
+        crawl_delay = self._crawl_delays.get(host)
+        if crawl_delay:
+            # Crawl-delayがあれば間隔を空けた1件ずつの送信に制限する
+            rate = min(rate, 1.0 / crawl_delay) if rate else 1.0 / crawl_delay
+            burst = 1
+        return rate, burst
+
+    def acquire(self, url):
+        """URLのホストのトークンを1つ消費する（足りなければ補充されるまで待機）"""
+        host = self._host(url)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if host not in self._completed:
+                    self._completed[host] = [0, now, now]
+                rate, burst = self._limits(host)
+                if not rate:
+                    return
+                tokens, last = self._buckets.get(host, (burst, now))
+                tokens = min(burst, tokens + (now - last) * rate)
+                if tokens >= 1:
+                    self._buckets[host] = (tokens - 1, now)
+                    return
+                self._buckets[host] = (tokens, now)
+                wait_time = (1 - tokens) / rate
+            time.sleep(wait_time)
+
+    def release(self, url, latency, status=None):
+        """リクエストの完了を通知する（statusは接続エラーならNone）"""
+        with self._lock:
+            completed = self._completed.get(self._host(url))
+            if completed:
+                completed[0] += 1
+                completed[2] = time.monotonic()
+
+    def report(self):
+        """ホストごとの実効レート（完了件数 / 最初の開始から最後の完了までの秒数）を返す"""
+        with self._lock:
+            hosts = {}
+            for host, (count, first, last) in self._completed.items():
+                hosts[host] = {
+                    'requests': count,
+                    'rate': round(count / (last - first), 3) if last > first else None,
+                    'crawl_delay': self._crawl_delays.get(host),
+                }
+            return hosts
+
+
+class AdaptiveHostController(HostRateLimiter):
+    """ホストごとの同時リクエスト数を応答時間と429/503に応じてAIMDで調整する
+
+    混雑の兆候（429/503・接続エラー・応答時間の急増）がなければ同時リクエスト数を増やし、
+    兆候があれば半分に減らす。レート制限とCrawl-delayは基底クラスの上限としてそのまま守る。
+    """
+
+    CONGESTION_STATUSES = (429, 503)
+
+    def __init__(self, rate, max_concurrency, initial_concurrency=1, latency_factor=2.0, min_latency_increase=0.05):
+        super().__init__(rate, burst=max_concurrency)
+        self.max_concurrency = max(1, max_concurrency)
+        self.initial_concurrency = max(1, min(initial_concurrency, self.max_concurrency))
+        self.latency_factor = latency_factor  # 基準の何倍の応答時間を急増とみなすか
+        self.min_latency_increase = min_latency_increase  # 急増とみなす最小の増加秒数（ごく短い応答の揺らぎを無視する）
+        self._hosts = {}
+        self._cond = threading.Condition(threading.Lock())
+
+    def _state(self, host):
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = {
+                'limit': float(self.initial_concurrency),
+                'in_flight': 0,
+                'latency': None,  # 応答時間の指数移動平均
+                'baseline': None,  # 混雑していないときの応答時間
+                'slow_start': True,  # 最初の混雑までは完了ごとに1ずつ増やす
+                'last_decrease': 0.0,
+                'decreases': 0,
+                'peak': float(self.initial_concurrency),
+            }
+        return state
+
+    def acquire(self, url):
+        host = self._host(url)
+        with self._cond:
+            state = self._state(host)
+            while state['in_flight'] >= int(state['limit']):
+                self._cond.wait()
+            state['in_flight'] += 1
+        super().acquire(url)
+
+    def release(self, url, latency, status=None):
+        super().release(url, latency, status)
+        host = self._host(url)
+        with self._cond:
+            state = self._state(host)
+            state['in_flight'] -= 1
+            congested = status is None or status in self.CONGESTION_STATUSES
+            if not congested:
+                average = latency if state['latency'] is None else 0.8 * state['latency'] + 0.2 * latency
+                state['latency'] = average
+                if state['baseline'] is None or average < state['baseline']:
+                    state['baseline'] = average
+                else:
+                    # サーバー側の状況の変化に追従できるよう基準はゆっくり引き上げる
+                    state['baseline'] += (average - state['baseline']) * 0.01
+                threshold = max(self.latency_factor * state['baseline'], state['baseline'] + self.min_latency_increase)
+                congested = latency > threshold and average > threshold
+            
+            now = time.monotonic()
+            if congested:
+                # 同じ混雑で続けて返ってきた応答では1回しか減らさない
+                if now - state['last_decrease'] >= max(state['latency'] or 0, 0.1):
+                    state['limit'] = max(1.0, state['limit'] / 2)
+                    state['slow_start'] = False
+                    state['last_decrease'] = now
+                    state['decreases'] += 1
+            elif state['slow_start']:
+                state['limit'] = min(self.max_concurrency, state['limit'] + 1)
+            else:
+                state['limit'] = min(self.max_concurrency, state['limit'] + 1 / state['limit'])
+            state['peak'] = max(state['peak'], state['limit'])
+            self._cond.notify_all()
+
+    def report(self):
+        hosts = super().report()
+        with self._cond:
+            for host, state in self._hosts.items():
+                if host in hosts:
+                    hosts[host].update({
+                        'concurrency': int(state['limit']),
+                        'peak_concurrency': int(state['peak']),
+                        'decreases': state['decreases'],
+                        'latency_ms': round(state['latency'] * 1000, 1) if state['latency'] is not None else None,
+                    })
+        return hosts
+
+
+class Metrics:
+    """ステージごとの処理時間・カウンター・キューの長さを集計する（スレッドセーフ）"""
+
+    # 処理時間ヒストグラムのバケット上限（ミリ秒、最後のバケットはそれ以上）
+    BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000, 60000)
+
+    def __init__(self):
+        self.started = time.time()
+        self._timers = {}  # ステージ名 -> [件数, 合計ms, 最小ms, 最大ms, バケットごとの件数]
+        self._counters = {}
+        self._gauges = {}  # 名前 -> [現在値, 最大値]
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        """with文のブロックの処理時間をステージの計測値として記録する"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def observe(self, name, seconds):
+        ms = seconds * 1000
+        index = bisect.bisect_left(self.BUCKETS_MS, ms)
+        with self._lock:
+            timer = self._timers.get(name)
+            if timer is None:
+                timer = self._timers[name] = [0, 0.0, ms, ms, [0] * (len(self.BUCKETS_MS) + 1)]
+            timer[0] += 1
+            timer[1] += ms
+            timer[2] = min(timer[2], ms)
+            timer[3] = max(timer[3], ms)
+            timer[4][index] += 1
+
+    def incr(self, name, n=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def gauge(self, name, value):
+        """キューの長さなどの現在値を記録する（最大値も保持する）"""
+        with self._lock:
+            current = self._gauges.get(name)
+            self._gauges[name] = [value, max(value, current[1]) if current else value]
+
+    def counter(self, name):
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def drain(self):
+        """処理時間・カウンター・ゲージを取り出してリセットする（ワーカープロセスから親へ送る）"""
+        with self._lock:
+            data = {'timers': self._timers, 'counters': self._counters, 'gauges': self._gauges}
+            self._timers = {}
+            self._counters = {}
+            self._gauges = {}
+        return data
+
+    def merge(self, data):
+        """drain() で取り出した計測値を加算する"""
+        with self._lock:
+            for name, (count, total, low, high, buckets) in data['timers'].items():
+                timer = self._timers.get(name)
+                if timer is None:
+                    self._timers[name] = [count, total, low, high, list(buckets)]
+                    continue
+                timer[0] += count
+                timer[1] += total
+                timer[2] = min(timer[2], low)
+                timer[3] = max(timer[3], high)
+                timer[4] = [a + b for a, b in zip(timer[4], buckets)]
+            for name, n in data['counters'].items():
+                self._counters[name] = self._counters.get(name, 0) + n
+            for name, (value, peak) in data.get('gauges', {}).items():
+                current = self._gauges.get(name)
+                self._gauges[name] = [value, max(peak, current[1]) if current else peak]
+
+    def _percentile(self, timer, q):
+        """バケットから百分位数を推定する（該当バケットの上限値、ただし最大値を超えない）"""
+        count, _, _, high, buckets = timer
+        rank = q * count
+        seen = 0
+        for index, n in enumerate(buckets):
+            seen += n
+            if seen >= rank and n:
+                if index < len(self.BUCKETS_MS):
+                    return min(self.BUCKETS_MS[index], high)
+                break
+        return high
+
+    def summary(self):
+        """集計結果をJSONに変換できる辞書で返す"""
+        with self._lock:
+            stages = {}
+            for name, timer in sorted(self._timers.items()):
+                count, total, low, high, buckets = timer
+                labels = [f"<={le}ms" for le in self.BUCKETS_MS] + [f">{self.BUCKETS_MS[-1]}ms"]
+                stages[name] = {
+                    'count': count,
+                    'total_ms': round(total, 3),
+                    'mean_ms': round(total / count, 3),
+                    'min_ms': round(low, 3),
+                    'p50_ms': round(self._percentile(timer, 0.5), 3),
+                    'p90_ms': round(self._percentile(timer, 0.9), 3),
+                    'p99_ms': round(self._percentile(timer, 0.99), 3),
+                    'max_ms': round(high, 3),
+                    'histogram': {label: n for label, n in zip(labels, buckets) if n},
+                }
+            return {
+                'elapsed_sec': round(time.time() - self.started, 3),
+                'stages': stages,
+                'counters': dict(sorted(self._counters.items())),
+                'gauges': {name: {'current': current, 'max': peak}
+                           for name, (current, peak) in sorted(self._gauges.items())},
+            }
+
+
+@functools.lru_cache(maxsize=None)
+def _counting_adapter_class():
+    """接続プールの新規接続数・リクエスト数を集計するHTTPAdapterのクラスを返す"""
+    from requests.adapters import HTTPAdapter
+
+    class _CountingAdapter(HTTPAdapter):
+        """接続プールの新規接続数・リクエスト数を集計するHTTPAdapter"""
+
+        def init_poolmanager(self, *args, **kwargs):
+            super().init_poolmanager(*args, **kwargs)
+            # プールが破棄される前にその統計を退避しておく
+            self._retired = [0, 0]
+            pools = self.poolmanager.pools
+            dispose = pools.dispose_func
+
+            def _dispose(pool):
+                self._retired[0] += pool.num_connections
+                self._retired[1] += pool.num_requests
+                if dispose:
+                    dispose(pool)
+
+            pools.dispose_func = _dispose
+
+        def pool_stats(self):
+            """(新規接続数, リクエスト数) を返す"""
+            opened, requested = self._retired
+            pools = self.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    opened += pool.num_connections
+                    requested += pool.num_requests
+            return opened, requested
+
+    return _CountingAdapter
+
+
+class HttpCache:
+    """ETag/Last-Modified付きのレスポンスをディスクに保存するLRUキャッシュ"""
+
+    def __init__(self, cache_dir, max_bytes=1024 * 1024 * 1024):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # キー -> [サイズ, 最終アクセス時刻]（起動時に一度だけディレクトリを走査する）
+        self._entries = {}
+        self.total_bytes = 0
+        for meta_path in self.cache_dir.glob('*.json'):
+            body_path = meta_path.with_suffix('.body')
+            try:
+                size = body_path.stat().st_size + meta_path.stat().st_size
+                self._entries[meta_path.stem] = [size, meta_path.stat().st_mtime]
+                self.total_bytes += size
+            except OSError:
+                continue
+
+    def _key(self, url):
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+    def lookup(self, url):
+        """キャッシュ済みのメタデータを返す（無ければNone）"""
+        key = self._key(url)
+        if key not in self._entries:
+            return None
+        try:
+            with open(self.cache_dir / f"{key}.json", 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return meta if meta.get('url') == url else None
+
+    def load_body(self, url):
+        """キャッシュ済みの本文を読み込み、LRUの順序を更新する"""
+        key = self._key(url)
+        body = (self.cache_dir / f"{key}.body").read_bytes()
+        now = time.time()
+        with self._lock:
+            if key in self._entries:
+                self._entries[key][1] = now
+        try:
+            os.utime(self.cache_dir / f"{key}.json", (now, now))
+        except OSError:
+            pass
+        return body
+
+    def store(self, url, response):
+        """検証子（ETag/Last-Modified）を持つレスポンスを保存する"""
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if not etag and not last_modified:
+            return
+        if 'no-store' in response.headers.get('Cache-Control', '').lower():
+            return
+        
+        key = self._key(url)
+        meta = {
+            'url': url,
+            'etag': etag,
+            'last_modified': last_modified,
+            'content_type': response.headers.get('Content-Type', ''),
+        }
+        meta_bytes = json.dumps(meta, ensure_ascii=False).encode('utf-8')
+        body = response.content
+        # 書き込み途中のファイルを読まないよう一時ファイルから置き換える
+        for suffix, data in (('.body', body), ('.json', meta_bytes)):
+            path = self.cache_dir / f"{key}{suffix}"
+            tmp_path = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        
+        size = len(body) + len(meta_bytes)
+        with self._lock:
+            old = self._entries.get(key)
+            if old:
+                self.total_bytes -= old[0]
+            self._entries[key] = [size, time.time()]
+            self.total_bytes += size
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """最も古くアクセスされたエントリから削除して容量の9割まで減らす"""
+        target = self.max_bytes * 0.9
+        for key, (size, _) in sorted(self._entries.items(), key=lambda item: item[1][1]):
+            if self.total_bytes <= target:
+                break
+            for suffix in ('.json', '.body'):
+                try:
+                    (self.cache_dir / f"{key}{suffix}").unlink()
+                except OSError:
+                    pass
+            del self._entries[key]
+            self.total_bytes -= size
+
+
+class WarcArchive:
+    """取得したレスポンスをWARC形式で追記保存する圧縮アーカイブ（URLごとの位置をSQLiteで索引する）
+
+    レコードごとに独立したgzipメンバーとして書き込むため、索引のオフセットから1件だけ読み出せる。
+    """
+
+    def __init__(self, archive_dir, max_file_bytes=1024 * 1024 * 1024, commit_interval=100, prefix='pages'):
+        self.archive_dir = Path(archive_dir)
+        self.archive_dir.mkdir(parents=True, exist_ok=True)
+        self.max_file_bytes = max_file_bytes
+        self.prefix = prefix
+        self.conn = sqlite3.connect(str(self.archive_dir / 'index.sqlite3'), timeout=60, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS records ('
+            ' url TEXT PRIMARY KEY,'
+            ' file TEXT,'
+            ' offset INTEGER,'
+            ' length INTEGER,'
+            ' fetched_at REAL,'
+            ' payload_digest TEXT)'
+        )
+        self.conn.commit()
+        self.commit_interval = commit_interval
+        self._pending = 0
+        self._lock = threading.Lock()
+        # 既存のファイルは上書きせず、最後のファイルの末尾から追記する
+        self.index = max(0, len(list(self.archive_dir.glob(f'{prefix}-*.warc.gz'))) - 1)
+        self.file = None
+        self.path = None
+
+    def _open_next(self):
+        if self.file is not None:
+            self.file.close()
+        self.path = self.archive_dir / f"{self.prefix}-{self.index:05d}.warc.gz"
+        self.index += 1
+        self.file = open(self.path, 'ab')
+
+    def _payload_digest(self, body):
+        return 'sha1:' + base64.b32encode(hashlib.sha1(body).digest()).decode('ascii')
+
+    def _build_record(self, url, response, body, digest):
+        """レスポンスを1件のWARC responseレコードのバイト列にする"""
+        # 本文は展開済みなので、転送時のエンコーディングと長さのヘッダーは付け直す
+        http_headers = [f"HTTP/1.1 {response.status_code} {response.reason or ''}".rstrip()]
+        for name, value in response.headers.items():
+            if name.lower() not in ('content-encoding', 'transfer-encoding', 'content-length'):
+                http_headers.append(f"{name}: {value}")
+        http_headers.append(f"Content-Length: {len(body)}")
+        block = ('\r\n'.join(http_headers) + '\r\n\r\n').encode('utf-8', 'replace') + body
+        warc_headers = [
+            'WARC/1.0',
+            'WARC-Type: response',
+            f"WARC-Record-ID: <urn:uuid:{uuid.uuid4()}>",
+            f"WARC-Date: {datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')}",
+            f"WARC-Target-URI: {url}",
+            f"WARC-Payload-Digest: {digest}",
+            'Content-Type: application/http; msgtype=response',
+            f"Content-Length: {len(block)}",
+        ]
+        return ('\r\n'.join(warc_headers) + '\r\n\r\n').encode('utf-8') + block + b'\r\n\r\n'
+
+    def append(self, url, response):
+        """レスポンスを追記する（前回保存した本文と同じなら追記しない）"""
+        body = response.content
+        digest = self._payload_digest(body)
+        with self._lock:
+            row = self.conn.execute('SELECT payload_digest FROM records WHERE url = ?', (url,)).fetchone()
+        if row and row[0] == digest:
+            return False
+        # 圧縮はロックの外で行い、追記と索引の更新だけを排他する
+        record = gzip.compress(self._build_record(url, response, body, digest))
+        with self._lock:
+            if self.file is None or self.file.tell() >= self.max_file_bytes:
+                self._open_next()
+            offset = self.file.tell()
+            self.file.write(record)
+            self.conn.execute(
+                'INSERT OR REPLACE INTO records (url, file, offset, length, fetched_at, payload_digest)'
+                ' VALUES (?, ?, ?, ?, ?, ?)',
+                (url, self.path.name, offset, len(record), time.time(), digest)
+            )
+            self._pending += 1
+            if self._pending >= self.commit_interval:
+                self.file.flush()
+                self.conn.commit()
+                self._pending = 0
+        return True
+
+    def load(self, url):
+        """URLの最新のレコードから本文のバイト列を読み出す（無ければNone）"""
+        with self._lock:
+            row = self.conn.execute('SELECT file, offset, length FROM records WHERE url = ?', (url,)).fetchone()
+        if row is None:
+            return None
+        name, offset, length = row
+        with open(self.archive_dir / name, 'rb') as f:
+            f.seek(offset)
+            record = gzip.decompress(f.read(length))
+        # WARCヘッダー、HTTPヘッダーの順に読み飛ばして本文を取り出す
+        _, block = record.split(b'\r\n\r\n', 1)
+        _, body = block.split(b'\r\n\r\n', 1)
+        return body[:-4]  # レコード末尾の区切り（CRLF 2つ）を除く
+
+    def iter_urls(self, batch_size=1000):
+        """保存されているURLを書き込んだ順に返す"""
+        last_rowid = 0
+        while True:
+            with self._lock:
+                rows = self.conn.execute('SELECT rowid, url FROM records WHERE rowid > ? ORDER BY rowid LIMIT ?',
+                                         (last_rowid, batch_size)).fetchall()
+            if not rows:
+                return
+            for last_rowid, url in rows:
+                yield url
+
+    def count(self):
+        with self._lock:
+            return self.conn.execute('SELECT COUNT(*) FROM records').fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+            self.conn.commit()
+            self.conn.close()
+
+
+class CrawlState:
+    """URLごとの取得日時・lastmod・本文ハッシュ・出力先をSQLiteに記録する"""
+
+    def __init__(self, db_path, commit_interval=100):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.db_path), timeout=60, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS pages ('
+            ' url TEXT PRIMARY KEY,'
+            ' fetched_at REAL,'
+            ' lastmod TEXT,'
+            ' content_hash TEXT,'
+            ' output_path TEXT,'
+            ' alias_of TEXT,'
+            ' simhash TEXT)'
+        )
+        # 以前のバージョンで作成したDBには重複検出用の列を追加する
+        columns = {row[1] for row in self.conn.execute('PRAGMA table_info(pages)')}
+        for column in ('alias_of', 'simhash'):
+            if column not in columns:
+                self.conn.execute(f'ALTER TABLE pages ADD COLUMN {column} TEXT')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS pages_content_hash ON pages (content_hash)')
+        self.conn.commit()
+        self.commit_interval = commit_interval
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def load(self):
+        """記録済みの {URL: lastmod} を1回のクエリで読み込む"""
+        with self._lock:
+            return dict(self.conn.execute('SELECT url, lastmod FROM pages'))
+
+    def get(self, url):
+        """URLの記録を辞書で返す（無ければNone）"""
+        with self._lock:
+            row = self.conn.execute(
+                'SELECT url, fetched_at, lastmod, content_hash, output_path, alias_of, simhash FROM pages WHERE url = ?',
+                (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('url', 'fetched_at', 'lastmod', 'content_hash', 'output_path', 'alias_of', 'simhash'), row))
+
+    def find_by_hash(self, content_hash, exclude_url=None):
+        """同じ本文ハッシュで保存済みの（エイリアスではない）ページを (URL, 出力先) で返す（無ければNone）"""
+        with self._lock:
+            return self.conn.execute(
+                'SELECT url, output_path FROM pages WHERE content_hash = ? AND alias_of IS NULL AND url != ? LIMIT 1',
+                (content_hash, exclude_url or '')
+            ).fetchone()
+
+    def load_simhashes(self):
+        """保存済みの（エイリアスではない）ページの (URL, SimHash) を順に返す"""
+        with self._lock:
+            rows = self.conn.execute(
+                'SELECT url, simhash FROM pages WHERE simhash IS NOT NULL AND alias_of IS NULL').fetchall()
+        for url, value in rows:
+            yield url, int(value, 16)
+
+    def record(self, url, lastmod=None, content_hash=None, output_path=None, fetched_at=None, alias_of=None,
+               simhash=None):
+        """ページの取得結果を記録する（一定件数ごとにコミット）"""
+        if fetched_at is None:
+            fetched_at = time.time()
+        with self._lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO pages (url, fetched_at, lastmod, content_hash, output_path, alias_of, simhash)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (url, fetched_at, lastmod, content_hash, str(output_path) if output_path else None, alias_of,
+                 f'{simhash:016x}' if simhash is not None else None)
+            )
+            self._pending += 1
+            if self._pending >= self.commit_interval:
+                self.conn.commit()
+                self._pending = 0
+
+    def update_lastmods(self, lastmods):
+        """lastmodが未記録のURLにサイトマップのlastmodを補完する"""
+        with self._lock:
+            self.conn.executemany('UPDATE pages SET lastmod = ? WHERE url = ?',
+                                  [(lastmod, url) for url, lastmod in lastmods.items()])
+            self.conn.commit()
+
+    def commit(self):
+        with self._lock:
+            self.conn.commit()
+            self._pending = 0
+
+    def close(self):
+        self.commit()
+        self.conn.close()
+
+
+def simhash(text, shingle_size=5):
+    """本文の文字 shingle_size-gram から64ビットのSimHashを求める（短すぎる場合はNone）"""
+    text = re.sub(r'\s+', ' ', text).strip().lower()
+    shingles = {text[i:i + shingle_size] for i in range(len(text) - shingle_size + 1)}
+    if len(shingles) < 2:
+        return None
+    # 各shingleの64ビットハッシュを連結し、バイト位置ごとの出現頻度からビットごとの多数決をとる
+    digests = b''.join(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest() for shingle in shingles)
+    half = len(shingles) / 2
+    value = 0
+    for position in range(8):
+        counts = Counter(digests[position::8])
+        for bit in range(8):
+            ones = sum(n for byte, n in counts.items() if byte >> (7 - bit) & 1)
+            if ones > half:
+                value |= 1 << (63 - position * 8 - bit)
+    return value
+
+
+class SimHashIndex:
+    """SimHashのハミング距離で近似重複を検索するメモリ上のインデックス"""
+
+    def __init__(self, max_distance=3):
+        self.max_distance = max_distance
+        # max_distance+1個のバンドに分ければ、距離がmax_distance以下の組は必ずどこかのバンドが一致する
+        self.bands = max_distance + 1
+        self.band_bits = 64 // self.bands
+        self._buckets = {}  # (バンド番号, バンドの値) -> [(SimHash, URL), ...]
+
+    def _band_keys(self, value):
+        mask = (1 << self.band_bits) - 1
+        return [(band, (value >> (band * self.band_bits)) & mask) for band in range(self.bands)]
+
+    def add(self, value, url):
+        for key in self._band_keys(value):
+            self._buckets.setdefault(key, []).append((value, url))
+
+    def find(self, value, exclude_url=None):
+        """距離がmax_distance以下で最も近いページを (URL, 距離) で返す（無ければNone）"""
+        best = None
+        for key in self._band_keys(value):
+            for other, url in self._buckets.get(key, ()):
+                if url == exclude_url:
+                    continue
+                distance = bin(value ^ other).count('1')
+                if distance <= self.max_distance and (best is None or distance < best[1]):
+                    best = (url, distance)
+        return best
+
+
+class WorkQueue:
+    """複数のワーカー（プロセス・ホスト）で共有する、リース付きのURL作業キュー（SQLite）
+
+    ワーカーは一定時間有効なリースを取得してURLを処理し、完了を記録する。
+    ワーカーが異常終了した場合は、期限切れのリースを他のワーカーが取り直す。
+    """
+
+    def __init__(self, db_path, lease_seconds=300, max_attempts=3):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        # 複数プロセスからの書き込みはトランザクションを短く保つため自動コミットで行う
+        self.conn = sqlite3.connect(str(self.db_path), timeout=60, check_same_thread=False, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS sites (base_url TEXT PRIMARY KEY, output_dir TEXT)')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS items ('
+            ' url TEXT PRIMARY KEY,'
+            ' site TEXT,'
+            ' lastmod TEXT,'
+            " status TEXT DEFAULT 'pending',"
+            ' owner TEXT,'
+            ' lease_expires REAL,'
+            ' attempts INTEGER DEFAULT 0,'
+            ' updated_at REAL)'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS items_site_status ON items (site, status)')
+        self._lock = threading.Lock()
+
+    def add_site(self, base_url, output_dir):
+        """サイトとその出力先（キューの出力ディレクトリからの相対パス）を登録する"""
+        with self._lock:
+            self.conn.execute('INSERT OR REPLACE INTO sites (base_url, output_dir) VALUES (?, ?)',
+                              (base_url, output_dir))
+
+    def sites(self):
+        """登録されているサイトを (ベースURL, 出力先) で返す"""
+        with self._lock:
+            return self.conn.execute('SELECT base_url, output_dir FROM sites ORDER BY rowid').fetchall()
+
+    def add(self, site, items):
+        """(URL, lastmod) を追加する（完了・失敗済みのURLは未処理に戻す）"""
+        now = time.time()
+        with self._lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                self.conn.executemany(
+                    'INSERT INTO items (url, site, lastmod, updated_at) VALUES (?, ?, ?, ?)'
+                    ' ON CONFLICT (url) DO UPDATE SET lastmod = excluded.lastmod, updated_at = excluded.updated_at,'
+                    "  attempts = CASE WHEN status IN ('done', 'failed') THEN 0 ELSE attempts END,"
+                    "  status = CASE WHEN status IN ('done', 'failed') THEN 'pending' ELSE status END",
+                    [(url, site, lastmod, now) for url, lastmod in items]
+                )
+                self.conn.execute('COMMIT')
+            except BaseException:
+                self.conn.execute('ROLLBACK')
+                raise
+
+    def lease(self, owner, site, limit):
+        """サイトの未処理（または期限切れのリース）のURLを最大limit件リースし、(URL, lastmod) のリストで返す"""
+        now = time.time()
+        with self._lock:
+            # 他のワーカーと同じURLを取らないよう、選択と更新を1つの書き込みトランザクションで行う
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                self.conn.execute(
+                    "UPDATE items SET status = 'failed', owner = NULL, lease_expires = NULL"
+                    " WHERE site = ? AND status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                    (site, now, self.max_attempts)
+                )
+                rows = self.conn.execute(
+                    "SELECT url, lastmod FROM items WHERE site = ?"
+                    " AND (status = 'pending' OR (status = 'leased' AND lease_expires < ?)) ORDER BY rowid LIMIT ?",
+                    (site, now, limit)
+                ).fetchall()
+                self.conn.executemany(
+                    "UPDATE items SET status = 'leased', owner = ?, lease_expires = ?, attempts = attempts + 1,"
+                    " updated_at = ? WHERE url = ?",
+                    [(owner, now + self.lease_seconds, now, url) for url, _ in rows]
+                )
+                self.conn.execute('COMMIT')
+            except BaseException:
+                self.conn.execute('ROLLBACK')
+                raise
+        return rows
+
+    def complete(self, owner, url):
+        """リースしていたURLを完了にする"""
+        with self._lock:
+            self.conn.execute(
+                "UPDATE items SET status = 'done', owner = NULL, lease_expires = NULL, updated_at = ?"
+                " WHERE url = ? AND owner = ?",
+                (time.time(), url, owner)
+            )
+
+    def release(self, owner):
+        """完了しなかったリースを返却する（試行回数が上限に達したURLは失敗にする）"""
+        with self._lock:
+            self.conn.execute(
+                "UPDATE items SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,"
+                " owner = NULL, lease_expires = NULL, updated_at = ? WHERE owner = ? AND status = 'leased'",
+                (self.max_attempts, time.time(), owner)
+            )
+
+    def available_sites(self):
+        """今すぐリースできるURLがあるサイトを返す"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT DISTINCT site FROM items WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?)",
+                (time.time(),)
+            ).fetchall()
+        return {site for site, in rows}
+
+    def counts(self):
+        """状態ごとのURL数を返す"""
+        with self._lock:
+            return dict(self.conn.execute('SELECT status, COUNT(*) FROM items GROUP BY status'))
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+class ResponseRejected(Exception):
+    """Content-Typeやサイズの上限により、本文を読み切らずに打ち切ったレスポンス"""
+
+    def __init__(self, reason, message):
+        super().__init__(message)
+        self.reason = reason  # 'content_type' または 'too_large'
+
+
+class _ChunkReader(io.RawIOBase):
+    """バイト列のチャンクのイテレーターを、readで少しずつ読み出せるファイルオブジェクトにする"""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buffer:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._buffer = chunk
+        size = min(len(b), len(self._buffer))
+        b[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+class HttpTransport:
+    """接続を使い回す共有HTTPクライアント（タイムアウト・リトライ付き）"""
+
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+    CHUNK_SIZE = 64 * 1024
+    # 文字コードの宣言を探す本文の先頭のバイト数（BeautifulSoupが必ず探す範囲）
+    CHARSET_SCAN_BYTES = 2048
+
+    def __init__(self, headers=None, timeout=30, max_retries=3, backoff=1.0, max_backoff=60, pool_size=10, cache=None,
+                 metrics=None, limiter=None):
+        self.timeout = timeout
+        self.limiter = limiter  # ホストごとのレート制限（リトライを含むすべての送信に適用する）
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.cache = cache
+        self.cache_hits = 0
+        self.cache_bytes_saved = 0
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retry_count = 0
+        self.request_count = 0
+        self._lock = threading.Lock()
+        
+        import requests
+        self.session = requests.Session()
+        if headers:
+            self.session.headers.update(headers)
+        # リトライは自前で行うため、urllib3側のリトライは無効にする
+        self.adapter = _counting_adapter_class()(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+
+    def _retry_after(self, response):
+        """Retry-Afterヘッダーから待機秒数を求める（無ければNone）"""
+        value = response.headers.get('Retry-After')
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(value)
+            return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return None
+
+    def get(self, url, max_bytes=None, content_types=None, **kwargs):
+        """GETリクエストを送信する（キャッシュがあれば条件付きGETで再検証する）
+
+        max_bytes か content_types を指定すると本文を少しずつ読み、Content-Typeが含まれないか
+        本文がmax_bytesを超えた時点で接続を閉じて ResponseRejected を送出する。
+        """
+        streaming = max_bytes is not None or content_types is not None
+        if streaming:
+            kwargs['stream'] = True
+        entry = self.cache.lookup(url) if self.cache else None
+        if entry:
+            headers = dict(kwargs.pop('headers', None) or {})
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+            kwargs['headers'] = headers
+        
+        response = self._request(url, **kwargs)
+        
+        if entry and response.status_code == 304:
+            response.close()
+            try:
+                body = self.cache.load_body(url)
+            except OSError:
+                # キャッシュ本文が消えていた場合は条件なしで取り直す
+                kwargs['headers'].pop('If-None-Match', None)
+                kwargs['headers'].pop('If-Modified-Since', None)
+                response = self._request(url, **kwargs)
+            else:
+                # 304レスポンスをキャッシュの内容で200レスポンスとして組み立てる
+                response.status_code = 200
+                response._content = body
+                if entry.get('content_type'):
+                    response.headers['Content-Type'] = entry['content_type']
+                response.from_cache = True
+                with self._lock:
+                    self.cache_hits += 1
+                    self.cache_bytes_saved += len(body)
+                return response
+        if streaming:
+            self._read_body(response, max_bytes, content_types)
+        if self.cache and response.status_code == 200:
+            try:
+                self.cache.store(url, response)
+            except OSError as e:
+                print(f"キャッシュへの保存に失敗しました {url}: {e}")
+        return response
+    
+    def check_head(self, url, max_bytes=None, content_types=None):
+        """HEADリクエストでContent-Typeとサイズを確認する（制限に反すれば ResponseRejected を送出する）
+
+        HEADに対応していないサーバーもあるため、エラーや200以外の応答では何もしない。
+        """
+        try:
+            response = self._request(url, method='HEAD', allow_redirects=True)
+        except Exception:
+            return
+        if response.status_code == 200:
+            self._check_headers(response, max_bytes, content_types)
+    
+    def _check_headers(self, response, max_bytes, content_types):
+        """本文を読む前にContent-TypeとContent-Lengthを確認する"""
+        if content_types and response.status_code == 200:
+            mime = response.headers.get('Content-Type', '').split(';', 1)[0].strip().lower()
+            # Content-Typeが無い場合は従来どおり解析を試みる
+            if mime and mime not in content_types:
+                response.close()
+                self.metrics.incr('http.rejected.content_type')
+                raise ResponseRejected('content_type', f"HTMLではないContent-Type: {mime}")
+        length = response.headers.get('Content-Length', '')
+        if max_bytes and length.isdigit() and int(length) > max_bytes:
+            response.close()
+            self.metrics.incr('http.rejected.too_large')
+            raise ResponseRejected('too_large', f"本文が上限の{max_bytes}バイトを超えています（{length}バイト）")
+    
+    def _text_decoder(self, head):
+        """本文の先頭で宣言された文字コードのインクリメンタルデコーダーを返す（宣言が無いか不明ならNone）
+
+        BeautifulSoupはContent-Typeのcharsetを知らないため、宣言が無い本文はバイト列のまま渡して
+        従来どおりBeautifulSoupに判定させる（ヘッダーが誤っていることも多い）。
+        """
+        from bs4.dammit import EncodingDetector
+        if head.startswith((codecs.BOM_UTF8, codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+            return None  # BOM付きの本文はBeautifulSoupの判定に任せる
+        # BeautifulSoupと同じ方法（XML宣言、<meta charset> と http-equiv）で宣言を探す
+        charset = EncodingDetector.find_declared_encoding(head[:self.CHARSET_SCAN_BYTES], is_html=True)
+        if not charset:
+            return None
+        try:
+            return codecs.getincrementaldecoder(charset)()
+        except LookupError:
+            return None
+    
+    def _read_body(self, response, max_bytes=None, content_types=None):
+        """ストリーミングのレスポンス本文を少しずつ読み込み、response.content に設定する
+
+        content_types を指定した場合は、本文の先頭で文字コードが宣言されていれば受信しながら
+        文字列に復号して response.text_content に設定する（解析時の文字コードの判定を省略できる）。
+        """
+        self._check_headers(response, max_bytes, content_types)
+        chunks = []
+        parts = []
+        decoder = None
+        # 先頭の CHARSET_SCAN_BYTES を受信するまでは文字コードを判定しない
+        pending = bool(content_types) and response.status_code == 200
+        size = 0
+        for chunk in response.iter_content(self.CHUNK_SIZE):
+            size += len(chunk)
+            if max_bytes and size > max_bytes:
+                response.close()
+                self.metrics.incr('http.bytes', size)
+                self.metrics.incr('http.rejected.too_large')
+                raise ResponseRejected('too_large', f"本文が上限の{max_bytes}バイトを超えました")
+            chunks.append(chunk)
+            if pending and size >= self.CHARSET_SCAN_BYTES:
+                pending = False
+                chunk = b''.join(chunks)
+                decoder = self._text_decoder(chunk)
+            if decoder is not None and not pending:
+                decoder = self._decode_chunk(decoder, chunk, parts)
+        response._content = b''.join(chunks)
+        response._content_consumed = True
+        self.metrics.incr('http.bytes', size)
+        if pending:
+            # 本文が CHARSET_SCAN_BYTES より短い
+            decoder = self._text_decoder(response._content)
+            if decoder is not None:
+                decoder = self._decode_chunk(decoder, response._content, parts)
+        response.text_content = None
+        if decoder is not None and self._decode_chunk(decoder, b'', parts, final=True) is not None:
+            response.text_content = ''.join(parts)
+    
+    def _decode_chunk(self, decoder, chunk, parts, final=False):
+        """復号した文字列を parts に追加する（宣言と異なる文字コードの本文ならNoneを返して復号をやめる）"""
+        try:
+            parts.append(decoder.decode(chunk, final=final))
+        except UnicodeDecodeError:
+            # BeautifulSoupと同じく、宣言どおりに復号できない本文は判定に任せる
+            return None
+        return decoder
+
+    def _request(self, url, method='GET', **kwargs):
+        """リクエストを送信する（429/5xxと接続エラーは指数バックオフでリトライ）"""
+        import requests
+        kwargs.setdefault('timeout', self.timeout)
+        attempt = 0
+        while True:
+            with self._lock:
+                self.request_count += 1
+            if self.limiter:
+                with self.metrics.stage('rate_limit_wait'):
+                    self.limiter.acquire(url)
+            status = None
+            started = time.perf_counter()
+            try:
+                with self.metrics.stage('http_request'):
+                    response = self.session.request(method, url, **kwargs)
+                status = response.status_code
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.metrics.incr(f"http.errors.{e.__class__.__name__}")
+                if attempt >= self.max_retries:
+                    raise
+                wait_time = self.backoff * (2 ** attempt)
+                reason = e.__class__.__name__
+            else:
+                self.metrics.incr(f"http.status.{response.status_code}")
+                if response.status_code not in self.RETRY_STATUSES or attempt >= self.max_retries:
+                    if not kwargs.get('stream'):
+                        self.metrics.incr('http.bytes', len(response.content))
+                    return response
+                wait_time = self._retry_after(response)
+                if wait_time is None:
+                    wait_time = self.backoff * (2 ** attempt)
+                reason = f"HTTP {response.status_code}"
+                response.close()
+            finally:
+                # 応答時間とステータス（接続エラーならNone）を伝えて同時リクエスト数の調整に使う
+                if self.limiter:
+                    self.limiter.release(url, time.perf_counter() - started, status)
+            
+            wait_time = min(wait_time, self.max_backoff)
+            attempt += 1
+            with self._lock:
+                self.retry_count += 1
+            self.metrics.incr('http.retries')
+            print(f"リトライ {attempt}/{self.max_retries} ({reason}): {url}（{wait_time:.1f}秒後）")
+            time.sleep(wait_time)
+
+    def stats(self):
+        """接続の新規作成数・再利用数とリトライ回数を返す"""
+        opened, requested = self.adapter.pool_stats()
+        return {
+            'requests': self.request_count,
+            'connections_opened': opened,
+            'connections_reused': max(0, requested - opened),
+            'retries': self.retry_count,
+            'cache_hits': self.cache_hits,
+            'cache_bytes_saved': self.cache_bytes_saved,
+        }
+
+    def close(self):
+        self.session.close()
+
+
+@functools.lru_cache(maxsize=None)
+def compile_selector(selector):
+    """CSSセレクターをsoupsieveでコンパイルする（同じセレクターは一度だけコンパイルする）"""
+    import soupsieve
+    return soupsieve.compile(selector)
+
+
+# 記事本文の抽出で使うデフォルトのセレクター（extract_content・extract_date と同じ順序）
+DEFAULT_STRIP_SELECTOR = ('header, footer, nav, aside, .sidebar, .advertisement, script, style, .widget, '
+                          '.wp-block-social-links')
+DEFAULT_CONTENT_SELECTORS = ('article', '.entry-content', '.post-content', 'main', '.main', '#main', '#content', 'body')
+DEFAULT_DATE_SOURCES = (
+    {'selector': 'meta[property="article:published_time"]', 'attr': 'content'},
+    {'selector': 'time', 'attr': 'datetime'},
+    {'selector': '.date'},
+    {'selector': '.published'},
+    {'selector': '.post-date'},
+    {'selector': '.entry-date'},
+)
+
+
+class ExtractionProfile:
+    """サイトごとの抽出ルール（本文のルート・除去する要素・日付・タイトル）をコンパイルして保持する
+
+    content と date は上から順に試し、最初に見つかったものを使う。
+    除去する要素は本文のルートの中だけで探すため、ページ全体を走査しない。
+    """
+
+    def __init__(self, content=None, strip=None, date=None, title=None):
+        self.config = {key: value for key, value in
+                       (('content', content), ('strip', strip), ('date', date), ('title', title)) if value}
+        self.content = [compile_selector(selector) for selector in self._as_list(content)]
+        if isinstance(strip, (list, tuple)):
+            strip = ', '.join(strip)
+        self.strip = compile_selector(strip) if strip else None
+        self.date_sources = [self._normalize_source(source) for source in self._as_list(date)]
+        self.date = [self._compile_source(source) for source in self.date_sources]
+        self.title = self._compile_source(title) if title else None
+
+    def _as_list(self, value):
+        if not value:
+            return []
+        return [value] if isinstance(value, (str, dict)) else list(value)
+
+    def _normalize_source(self, source):
+        return {'selector': source} if isinstance(source, str) else dict(source)
+    
+    def _compile_source(self, source):
+        """{'selector': ..., 'attr': ...}（または文字列のセレクター）を (コンパイル済みセレクター, 属性名) にする"""
+        source = self._normalize_source(source)
+        return compile_selector(source['selector']), source.get('attr')
+
+    @classmethod
+    def load(cls, path, base_url):
+        """JSONファイルから base_url のホスト（wwwの有無は区別しない）のプロファイルを読み込む（無ければNone）"""
+        with open(path, 'r', encoding='utf-8') as f:
+            profiles = json.load(f)
+        host = (urlsplit(base_url).hostname or '').lower()
+        for key, config in profiles.items():
+            key_host = (urlsplit(key).hostname if '//' in key else key).lower()
+            if key_host.removeprefix('www.') == host.removeprefix('www.'):
+                return cls(**config)
+        return None
+
+    def _source_value(self, soup, source, date=False):
+        """取得元の要素の属性値（attr 指定時）またはテキストを返す（要素か属性が無ければNone）"""
+        pattern, attr = source
+        elem = pattern.select_one(soup)
+        if elem is None:
+            return None
+        if attr:
+            value = elem.get(attr)
+            if value and date:
+                return value.split('T')[0]  # ISOフォーマットの日付部分のみ
+            return value or None
+        return elem.text.strip()
+
+    def find_content(self, soup):
+        """本文のルート要素を探し、その中の不要な要素を除去して返す（見つからなければNone）"""
+        for pattern in self.content:
+            root = pattern.select_one(soup)
+            if root is not None:
+                if self.strip is not None:
+                    for elem in self.strip.select(root):
+                        elem.decompose()
+                return root
+        return None
+
+    def match_date(self, soup):
+        """日付と、それが見つかった取得元の設定を返す（見つからなければ (None, None)）"""
+        for config, source in zip(self.date_sources, self.date):
+            value = self._source_value(soup, source, date=True)
+            if value is not None:
+                return value, config
+        return None, None
+    
+    def find_date(self, soup):
+        return self.match_date(soup)[0]
+
+    def find_title(self, soup):
+        # 空のタイトルは見つからなかったものとして <title> に戻す
+        return (self._source_value(soup, self.title) or None) if self.title else None
+
+
+# デフォルトの本文の候補（extract_content で順に試す2つのグループ）
+_DEFAULT_ARTICLE_SELECTOR = 'article, .entry-content, .post-content, main'
+_DEFAULT_MAIN_SELECTOR = 'main, .main, #main, #content'
+
+
+@functools.lru_cache(maxsize=None)
+def _default_date_profile():
+    return ExtractionProfile(date=DEFAULT_DATE_SOURCES)
+
+
+class ExtractionProfileLearner:
+    """最初のN件のページでどのセレクターが当たったかを記録し、すべて同じなら学習済みのプロファイルを作る"""
+
+    def __init__(self, pages=20):
+        self.pages = pages
+        self.content_patterns = [(selector, compile_selector(selector)) for selector in DEFAULT_CONTENT_SELECTORS]
+        self._content_hits = None  # すべてのページで本文のルートと一致したセレクター
+        self._date_hits = None  # すべてのページで最初に日付が見つかった取得元
+        self._observed = 0
+        self.profile = None
+        self._lock = threading.Lock()
+
+    def content_candidates(self, soup):
+        """不要な要素を除去する前に、各セレクターが最初に見つける要素を調べる"""
+        return [(selector, pattern.select_one(soup)) for selector, pattern in self.content_patterns]
+
+    def observe(self, candidates, article, date_source):
+        """1ページ分の結果（デフォルトの抽出で選ばれた本文と日付の取得元）を記録する"""
+        # 除去前にそのセレクターで探しても同じ要素になるなら、除去を本文の中だけで済ませられる
+        content_hits = [selector for selector, candidate in candidates if article is not None and candidate is article]
+        with self._lock:
+            if self.profile is not None or self._observed >= self.pages:
+                return None
+            if self._content_hits is None:
+                self._content_hits, self._date_hits = content_hits, date_source
+            else:
+                self._content_hits = [selector for selector in self._content_hits if selector in content_hits]
+                if self._date_hits != date_source:
+                    self._date_hits = None
+            self._observed += 1
+            if self._observed < self.pages or not self._content_hits:
+                return None
+            self.profile = ExtractionProfile(content=self._content_hits[0], strip=DEFAULT_STRIP_SELECTOR,
+                                             date=[self._date_hits] if self._date_hits else None)
+            return self.profile
+
+
+class TreeMarkdownConverter:
+    """解析済みのBeautifulSoupツリーをたどり、HTML2Textに直接イベントを渡してMarkdownに変換する
+
+    HTML文字列への再シリアライズとHTMLParserによる再解析を省略する。
+    HTML2Textが受け取るイベント列は str(tag) を handle() に渡した場合と同じになるため、
+    出力も同じになる。HTML2Textは変換の状態を持ち越すため、ページごとに新しく作って渡す。
+    """
+
+    # str(tag) がエスケープする文字（HTMLParserからは実体参照として届く）
+    _ESCAPED_CHARS = re.compile(r'([&<>])')
+    # HTMLParserが中身をそのままテキストとして扱う要素
+    _RAW_TEXT_ELEMENTS = ('script', 'style')
+
+    def __init__(self, h2t):
+        self.h2t = h2t
+        self._text = []
+
+    def convert(self, node):
+        """TagまたはBeautifulSoupオブジェクトをMarkdownに変換する"""
+        from bs4 import BeautifulSoup
+        from bs4.element import Tag, NavigableString, PreformattedString
+        from html2text.utils import pad_tables_in_text
+        h = self.h2t
+        h.start = True
+        self._text = []
+        
+        # 再帰の深さ制限を避けるため明示的なスタックでたどる
+        stack = [(node, True)]
+        while stack:
+            elem, entering = stack.pop()
+            if isinstance(elem, Tag):
+                is_document = isinstance(elem, BeautifulSoup)
+                if not entering:
+                    self._flush()
+                    if not is_document:
+                        h.handle_endtag(elem.name)
+                    continue
+                if not is_document:
+                    self._flush()
+                    h.handle_starttag(elem.name, self._attrs(elem))
+                stack.append((elem, False))
+                stack.extend((child, True) for child in reversed(elem.contents))
+            elif isinstance(elem, PreformattedString):
+                # コメント・DOCTYPEなどは出力しないが、テキストの区切りにはなる
+                self._flush()
+            elif isinstance(elem, NavigableString):
+                parent = elem.parent
+                raw = parent is not None and parent.name in self._RAW_TEXT_ELEMENTS
+                self._text.append((str(elem), raw))
+        self._flush()
+        
+        markdown = h.optwrap(h.finish())
+        if h.pad_tables:
+            return pad_tables_in_text(markdown)
+        return markdown
+
+    def _attrs(self, elem):
+        """属性をHTMLParserと同じ (名前, 値) のリストにする"""
+        return [(name, ' '.join(value) if isinstance(value, list) else value)
+                for name, value in elem.attrs.items()]
+
+    def _flush(self):
+        """連続したテキストをまとめてHTML2Textに渡す"""
+        if not self._text:
+            return
+        h = self.h2t
+        raw = self._text[0][1]
+        data = ''.join(text for text, _ in self._text)
+        self._text = []
+        if raw:
+            h.handle_data(data)
+            return
+        # エスケープされる文字は実体参照と同じく entity_char=True で渡す
+        for i, part in enumerate(self._ESCAPED_CHARS.split(data)):
+            if not part:
+                continue
+            h.handle_data(part, i % 2 == 1)
+
+
+class OutputSink:
+    """記事の出力先の基底クラス（write で1件ずつ受け取り、close で確定する）"""
+
+    def write(self, page):
+        """記事情報を出力し、保存先（クロール状態に記録する）を返す"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class MarkdownDirSink(OutputSink):
+    """記事を1件ずつMarkdownファイルとして保存し、URL・保存先・本文のハッシュをマニフェストに追記する
+
+    layout が 'sharded' のときは URL のハッシュの先頭2文字のサブディレクトリに
+    「スラッグ-URLのハッシュ8文字.md」として保存する（ファイル名はURLだけで決まり衝突しない）。
+    'flat' では従来どおり出力先の直下にスラッグで保存し、同じ名前を別のURLが使っていればハッシュを付ける。
+    """
+
+    def __init__(self, scraper, output_dir, layout='flat', manifest_name='manifest.jsonl'):
+        self.scraper = scraper
+        self.output_dir = Path(output_dir)
+        self.layout = layout
+        self.manifest_path = self.output_dir / manifest_name
+        self.manifest = None
+        # 出力先の相対パス -> それを使っているURL（flatでの名前の衝突の判定に使う）
+        self.claims = self.load_manifest(self.output_dir) if layout == 'flat' else {}
+
+    @staticmethod
+    def iter_manifest(output_dir):
+        """出力先のマニフェスト（ワーカーごとのファイルを含む）の記録を書き込んだ順に返す"""
+        for manifest_path in sorted(Path(output_dir).glob('manifest*.jsonl')):
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue  # 中断された書き込みの途中の行
+
+    @classmethod
+    def load_manifest(cls, output_dir):
+        return {entry['path']: entry['url'] for entry in cls.iter_manifest(output_dir)}
+
+    def _file_url(self, relpath):
+        """既存のMarkdownファイルのメタデータからURLを読み取る（マニフェストより前に保存されたファイル用）"""
+        try:
+            with open(self.output_dir / relpath, 'r', encoding='utf-8') as f:
+                for line in itertools.islice(f, 10):
+                    if line.startswith('url: '):
+                        return line[5:].strip()
+        except OSError:
+            return None
+        return None
+
+    def path_for(self, page):
+        """記事を保存する出力先からの相対パスを返す"""
+        url = page.get('url', '')
+        name = self.scraper.markdown_filename(page)
+        digest = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        if self.layout == 'sharded':
+            return f"{digest[:2]}/{name}-{digest[:8]}.md"
+        relpath = f"{name}.md"
+        owner = self.claims.get(relpath)
+        if owner is None and (self.output_dir / relpath).exists():
+            owner = self._file_url(relpath)
+        if owner is not None and owner != url:
+            relpath = f"{name}-{digest[:8]}.md"
+        return relpath
+
+    def write(self, page):
+        relpath = self.path_for(page)
+        filepath = self.scraper.save_to_markdown(page, self.output_dir / relpath)
+        self.claims[relpath] = page.get('url', '')
+        if self.manifest is None:
+            self.manifest = open(self.manifest_path, 'a', encoding='utf-8')
+        content_hash = hashlib.sha256(page.get('content', '').encode('utf-8')).hexdigest()
+        entry = {'url': page.get('url', ''), 'path': relpath, 'content_hash': content_hash}
+        # 1行ずつ書き出して、中断しても書き込み済みのファイルとマニフェストが一致するようにする
+        self.manifest.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self.manifest.flush()
+        return filepath
+
+    def close(self):
+        if self.manifest is not None:
+            self.manifest.close()
+            self.manifest = None
+
+
+class JsonlSink(OutputSink):
+    """すべての記事を1つのJSON Linesファイルに追記する"""
+
+    def __init__(self, path, buffer_size=1024 * 1024):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.file = open(self.path, 'a', encoding='utf-8', buffering=buffer_size)
+
+    def write(self, page):
+        self.file.write(json.dumps(page, ensure_ascii=False) + '\n')
+        return self.path
+
+    def close(self):
+        self.file.close()
+
+
+class ShardedArchiveSink(OutputSink):
+    """記事をgzip圧縮したJSON Linesのシャードに書き込み、一定サイズごとに新しいシャードに切り替える"""
+
+    def __init__(self, shard_dir, max_shard_bytes=64 * 1024 * 1024, prefix='articles'):
+        self.shard_dir = Path(shard_dir)
+        self.shard_dir.mkdir(parents=True, exist_ok=True)
+        self.max_shard_bytes = max_shard_bytes
+        self.prefix = prefix
+        # 既存のシャードは上書きせず、最大の番号の次から書き始める（途中のシャードが削除されていても重ならない）
+        pattern = re.compile(rf'^{re.escape(prefix)}-(\d{{5}})\.jsonl\.gz$')
+        numbers = [int(m.group(1)) for m in map(pattern.match, os.listdir(self.shard_dir)) if m]
+        self.index = max(numbers) + 1 if numbers else 0
+        self.raw_file = None
+        self.file = None
+        self.path = None
+
+    def _open_next(self):
+        self.close()
+        while True:
+            self.path = self.shard_dir / f"{self.prefix}-{self.index:05d}.jsonl.gz"
+            self.index += 1
+            try:
+                # 同じ番号のシャードが既にあれば上書きせずに次の番号を使う
+                self.raw_file = open(self.path, 'xb')
+                break
+            except FileExistsError:
+                continue
+        self.file = gzip.GzipFile(fileobj=self.raw_file, mode='wb')
+
+    def write(self, page):
+        if self.file is None or self.raw_file.tell() >= self.max_shard_bytes:
+            self._open_next()
+        self.file.write((json.dumps(page, ensure_ascii=False) + '\n').encode('utf-8'))
+        return self.path
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.raw_file.close()
+            self.file = None
+            self.raw_file = None
+
+
+# 記事として解析するContent-Type（これ以外は本文を読まずに打ち切る）
+HTML_CONTENT_TYPES = ('text/html', 'application/xhtml+xml')
+# --head-check でGETの前にHEADで確認する、HTMLではないことが多い拡張子
+NON_HTML_EXTENSIONS = ('.pdf', '.zip', '.gz', '.tgz', '.bz2', '.xz', '.7z', '.rar', '.tar', '.jpg', '.jpeg', '.png',
+                       '.gif', '.webp', '.svg', '.ico', '.mp3', '.mp4', '.m4a', '.mov', '.avi', '.wmv', '.webm',
+                       '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx', '.exe', '.dmg', '.iso', '.apk', '.csv')
+
+
+class WebsiteScraper:
+    def __init__(self, base_url, output_dir="scraped_articles", delay=1, sitemap_url=None, try_wordpress_sitemaps=False,
+                 concurrency=1, rate=None, timeout=30, max_retries=3, cache_dir=None, cache_size_mb=1024,
+                 state_db=None, markdown_engine='html2text', parser='html.parser', workers=None,
+                 output_format='markdown', shard_size_mb=64, max_depth=2, stats_path=None, progress_interval=30,
+                 profile_path=None, duplicates='alias', near_duplicates=False, near_duplicate_distance=3,
+                 archive_dir=None, from_archive=False, adaptive=False, ignore_robots=False, worker_id=None,
+                 extraction_profiles=None, learn_extraction=0, markdown_layout='flat', max_page_size_mb=10,
+                 head_check=False):
+        self.base_url = base_url
+        self.visited_urls = set()
+        self.sitemap_lastmods = {}  # XMLサイトマップの <lastmod>（URL -> lastmod）
+        self._lock = threading.Lock()
+        self.user_agent = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+        self.headers = {'User-Agent': self.user_agent}
+        self.output_dir = Path(output_dir)
+        self.delay = delay
+        self.sitemap_url = sitemap_url
+        self.max_depth = max_depth  # HTMLサイトマップでカテゴリー・ページネーションをたどる深さ
+        self.base_scheme = urlsplit(base_url).scheme.lower() or 'https'
+        self.try_wordpress_sitemaps = try_wordpress_sitemaps
+        self.state_db = Path(state_db) if state_db else self.output_dir / '.crawl_state.sqlite3'
+        self.output_format = output_format
+        # Markdownの保存先の配置（flat: 出力先の直下、sharded: URLのハッシュで分けたサブディレクトリ）
+        self.markdown_layout = markdown_layout
+        self._output_dirs = set()
+        self.shard_size_mb = shard_size_mb
+        # 本文が同じページの扱い（alias: aliases.jsonlに記録して書き込まない、skip: 書き込まない、keep: すべて書き込む）
+        self.duplicates = duplicates
+        self.near_duplicates = near_duplicates
+        self.near_duplicate_distance = near_duplicate_distance
+        self.concurrency = max(1, concurrency)
+        # 共有キューのワーカーとして動くときの識別子（複数のワーカーが同じ出力先に書き込むファイルを分ける）
+        self.worker_id = worker_id
+        
+        # 取得したHTMLをそのまま保存するアーカイブ（from_archiveならネットワークに接続せずここから読み出す）
+        self.archive = None
+        if archive_dir:
+            self.archive = WarcArchive(archive_dir, prefix=self._worker_file_name('pages'),
+                                       commit_interval=1 if worker_id else 100)
+        self.from_archive = from_archive
+        if from_archive and self.archive is None:
+            raise ValueError("from_archive には archive_dir の指定が必要です")
+        if workers is None:
+            # アーカイブからの再抽出はCPUだけで完結するため、既定ですべてのコアを使う
+            workers = (os.cpu_count() or 1) if from_archive else 0
+        self.workers = max(0, workers)  # 解析・変換を行うプロセス数（0なら取得と同じスレッドで処理）
+        
+        # ステージごとの計測値（--stats で定期的・終了時にJSONへ書き出す）
+        self.metrics = Metrics()
+        self.stats_path = Path(stats_path) if stats_path else None
+        self.progress_interval = progress_interval
+        self.crawl_counts = {}
+        # --profile 指定時はスレッドごとのcProfileでページ処理を計測する
+        self.profile_path = profile_path
+        self._profilers = []
+        self._profile_local = threading.local()
+        
+        # ホスト単位のレート制限（指定がなければ --delay から算出、adaptiveでは --rate の指定時のみ）
+        if from_archive:
+            rate = None
+        elif rate is None and not adaptive:
+            rate = 1.0 / delay if delay > 0 else None
+        self.adaptive = adaptive
+        if adaptive:
+            # 同時リクエスト数は応答に応じて1から --concurrency の範囲で調整する
+            self.rate_limiter = AdaptiveHostController(rate, max_concurrency=self.concurrency)
+        else:
+            self.rate_limiter = HostRateLimiter(rate, burst=self.concurrency)
+        
+        # robots.txtのDisallowとCrawl-delayは上限として守る（ホストごとに1回だけ取得する）
+        self.ignore_robots = ignore_robots
+        self._robots = {}
+        self._robots_lock = threading.Lock()
+        
+        # ページの本文の上限（0なら無制限）と、HTMLではなさそうなURLをHEADで確認するかどうか
+        self.max_page_bytes = int(max_page_size_mb * 1024 * 1024) or None
+        self.head_check = head_check
+        
+        # すべてのリクエストで共有するHTTPトランスポート（キャッシュは任意）
+        cache = HttpCache(cache_dir, max_bytes=int(cache_size_mb * 1024 * 1024)) if cache_dir else None
+        self.transport = HttpTransport(headers=self.headers, timeout=timeout, max_retries=max_retries,
+                                       pool_size=max(10, self.concurrency), cache=cache, metrics=self.metrics,
+                                       limiter=self.rate_limiter)
+        
+        # 'dom' は解析済みツリーを直接変換する（html2textと同じ出力で再解析を省略）
+        self.markdown_engine = markdown_engine
+        
+        # HTMLパーサー（lxmlが無ければ標準のhtml.parserを使う）
+        if parser == 'lxml':
+            try:
+                import lxml  # noqa: F401
+            except ImportError:
+                print("lxmlがインストールされていないため、html.parserを使用します")
+                parser = 'html.parser'
+        self.parser = parser
+        
+        # サイトごとの抽出プロファイル（JSONファイル）。無ければ最初のlearn_extraction件から学習する（0なら学習しない）
+        self.extraction_profiles = extraction_profiles
+        self.learn_extraction = learn_extraction
+        self.extraction_profile = None
+        if extraction_profiles:
+            self.extraction_profile = ExtractionProfile.load(extraction_profiles, base_url)
+        self.extraction_learner = None
+        if self.extraction_profile is None and learn_extraction > 0:
+            self.extraction_learner = ExtractionProfileLearner(pages=learn_extraction)
+        
+    def create_h2t(self):
+        """設定済みのhtml2textコンバーターを作る（URLの列挙だけなら読み込まないよう、変換時に呼ぶ）
+
+        HTML2Textは改行や出力位置などの状態を変換の後も持ち越すため、使い回すと
+        直前に変換したページによって出力が変わる。ページごとに新しく作る。
+        """
+        import html2text
+        h2t = html2text.HTML2Text()
+        h2t.ignore_links = False
+        h2t.ignore_images = True
+        h2t.body_width = 0  # 自動折り返しなし
+        h2t.unicode_snob = True  # Unicode文字を保持
+        h2t.bypass_tables = False  # テーブルを保持
+        h2t.mark_code = True  # コードブロックをマークダウン形式で保持
+        return h2t
+    
+    def fetch_content(self, url, archive=False):
+        """URLからHTMLを取得して本文（復号済みの文字列またはバイト列）を返す（--from-archive ではアーカイブから読み出す）
+
+        archive=True のときだけ取得したレスポンスをアーカイブに保存する。--from-archive は
+        アーカイブの全URLを記事として抽出し直すため、一覧ページなど記事以外のページは保存しない。
+        """
+        if self.from_archive:
+            with self.metrics.stage('archive_read'):
+                content = self.archive.load(url)
+            if content is None:
+                self.metrics.incr('pages.failed')
+                print(f"アーカイブに見つかりません: {url}")
+            return content
+        try:
+            with self.metrics.stage('fetch'):
+                if self.head_check and urlsplit(url).path.lower().endswith(NON_HTML_EXTENSIONS):
+                    self.transport.check_head(url, self.max_page_bytes, HTML_CONTENT_TYPES)
+                # 本文は少しずつ読み、HTML以外や上限を超える本文はその時点で打ち切る
+                response = self.transport.get(url, max_bytes=self.max_page_bytes, content_types=HTML_CONTENT_TYPES)
+                response.raise_for_status()  # エラーチェック
+        except ResponseRejected as e:
+            self.metrics.incr('pages.rejected')
+            print(f"スキップ（{e}）: {url}")
+            return None
+        except Exception as e:
+            self.metrics.incr('pages.failed')
+            print(f"Error fetching {url}: {e}")
+            return None
+        if archive and self.archive:
+            try:
+                with self.metrics.stage('archive_write'):
+                    self.archive.append(url, response)
+            except OSError as e:
+                print(f"アーカイブへの保存に失敗しました {url}: {e}")
+        # 受信しながら復号した文字列があれば、解析時の文字コードの判定を省略できるようそれを返す
+        text = getattr(response, 'text_content', None)
+        return text if text is not None else response.content
+    
+    def get_soup(self, url, archive=False):
+        """URLからHTMLを取得してBeautifulSoupオブジェクトを返す（archiveはfetch_contentを参照）"""
+        content = self.fetch_content(url, archive=archive)
+        if content is None:
+            return None
+        from bs4 import BeautifulSoup
+        with self.metrics.stage('parse'):
+            return BeautifulSoup(content, self.parser)
+    
+    def extract_content(self, soup):
+        """記事の本文コンテンツを抽出する"""
+        if soup is None:
+            return None
+            
+        # ヘッダー、フッター、サイドバー、広告などの不要要素を削除
+        for elem in compile_selector(DEFAULT_STRIP_SELECTOR).select(soup):
+            if elem:
+                elem.decompose()
+        
+        # 記事の本文を取得（サイトの構造によって調整が必要）
+        article = compile_selector(_DEFAULT_ARTICLE_SELECTOR).select_one(soup)
+        
+        if not article:
+            # 記事要素が見つからない場合はmain要素を探す
+            article = compile_selector(_DEFAULT_MAIN_SELECTOR).select_one(soup)
+            
+        if not article:
+            # それでも見つからない場合はbody要素を使用
+            article = soup.body
+            
+        return article
+    
+    def html_to_markdown(self, html_content):
+        """HTMLコンテンツをMarkdownに変換する"""
+        if html_content is None:
+            return ""
+        from bs4 import BeautifulSoup
+        from bs4.element import Tag
+        
+        # 解析済みのツリーはHTML文字列に戻さずにそのまま変換する
+        if self.markdown_engine == 'dom' and isinstance(html_content, Tag):
+            return TreeMarkdownConverter(self.create_h2t()).convert(html_content)
+        
+        # BeautifulSoupオブジェクトをHTML文字列に変換
+        if isinstance(html_content, BeautifulSoup) or hasattr(html_content, 'prettify'):
+            html_string = str(html_content)
+        else:
+            html_string = str(html_content)
+            
+        # html2textを使ってMarkdownに変換（ページごとに新しいコンバーターを使うため並列でも排他しない）
+        return self.create_h2t().handle(html_string)
+    
+    def extract_links(self, soup, current_url):
+        """ページ内のリンクを抽出する"""
+        if soup is None:
+            return []
+            
+        links = []
+        seen = set()
+        for a_tag in soup.find_all('a', href=True):
+            href = a_tag['href']
+            # 相対URLを絶対URLに変換
+            absolute_url = urljoin(current_url, href)
+            
+            # 同じサイト内のURLのみを正規化して収集
+            if not self.is_same_site(absolute_url):
+                continue
+            url = canonicalize_url(absolute_url, scheme=self.base_scheme)
+            key = url_key(url)
+            if key not in seen:
+                seen.add(key)
+                links.append(url)
+                
+        return links
+    
+    def is_same_site(self, url):
+        """URLがベースURLと同じサイト（wwwの有無は区別しない）の配下にあるかを判定する"""
+        parts = urlsplit(url)
+        if parts.scheme.lower() not in ('http', 'https'):
+            return False
+        base = urlsplit(self.base_url)
+        host = (parts.hostname or '').lower()
+        base_host = (base.hostname or '').lower()
+        if host.startswith('www.'):
+            host = host[4:]
+        if base_host.startswith('www.'):
+            base_host = base_host[4:]
+        if host != base_host:
+            return False
+        base_path = base.path.rstrip('/')
+        return not base_path or parts.path == base_path or parts.path.startswith(base_path + '/')
+    
+    def sanitize_filename(self, title):
+        """ファイル名に使用できない文字を置換する"""
+        # 無効な文字を削除または置換
+        filename = re.sub(r'[\\/*?:"<>|]', "", title)
+        # スペースをアンダースコアに置換
+        filename = filename.replace(' ', '_')
+        # 長すぎる場合は切り詰める
+        if len(filename) > 100:
+            filename = filename[:100]
+        return filename
+    
+    def markdown_filename(self, page):
+        """URLのスラッグ（無ければタイトル）から拡張子なしのファイル名を作る"""
+        # URLからスラッグを抽出してファイル名に使用
+        parsed_url = urlparse(page.get('url', ''))
+        path_parts = parsed_url.path.strip('/').split('/')
+        slug = path_parts[-1] if path_parts else 'index'
+        
+        # ファイル名を生成（スラッグがない場合はタイトルを使用）
+        if slug == 'index' or not slug:
+            return self.sanitize_filename(page.get('title', 'No Title'))
+        return self.sanitize_filename(slug)
+    
+    def save_to_markdown(self, page, filepath=None):
+        """ページ情報をMarkdownファイルとして保存する（一時ファイルに書いてから置き換える）"""
+        title = page.get('title', 'No Title')
+        url = page.get('url', '')
+        content = page.get('content', '')
+        date = page.get('date', '')
+        
+        if filepath is None:
+            filepath = self.output_dir / f"{self.markdown_filename(page)}.md"
+        filepath = Path(filepath)
+        
+        # 出力ディレクトリが存在しない場合は作成（作成済みのディレクトリは確認しない）
+        if filepath.parent not in self._output_dirs:
+            filepath.parent.mkdir(parents=True, exist_ok=True)
+            self._output_dirs.add(filepath.parent)
+        
+        # 書き込み途中のファイルが残らないよう、同じディレクトリの一時ファイルに書いてから置き換える
+        tmp_path = filepath.with_name(f".{filepath.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            # メタデータ部分を書き込み
+            f.write(f"---\n")
+            f.write(f"title: {title}\n")
+            f.write(f"url: {url}\n")
+            if date:
+                f.write(f"date: {date}\n")
+            f.write(f"---\n\n")
+            
+            # 本文を書き込み
+            f.write(content)
+        os.replace(tmp_path, filepath)
+            
+        return filepath
+    
+    def extract_date(self, soup):
+        """記事の公開日を抽出する"""
+        return self._match_date(soup)[0]
+    
+    def _match_date(self, soup):
+        """記事の公開日と、それが見つかった取得元を返す"""
+        if soup is None:
+            return "", None
+        # metaタグ、time要素、日付らしきクラス名を持つ要素の順に探す（DEFAULT_DATE_SOURCES）
+        date, source = _default_date_profile().match_date(soup)
+        return (date, source) if date is not None else ("", None)
+    
+    def process_page(self, url):
+        """指定されたURLのページを処理する（--profile 指定時はcProfileで計測する）"""
+        if self.profile_path:
+            return self._profile_call(self._process_page, url)
+        return self._process_page(url)
+    
+    def _process_page(self, url):
+        with self._lock:
+            if url in self.visited_urls:
+                return
+            self.visited_urls.add(url)
+            
+        print(f"Processing: {url}")
+        
+        soup = self.get_soup(url, archive=True)
+        if soup:
+            return self.extract_page(url, soup)
+        
+        return None
+    
+    def extract_page(self, url, soup):
+        """解析済みのページからタイトル・日付・本文を抽出して記事情報を返す"""
+        # サイトのプロファイル（指定または学習済み）があれば先に使い、見つからなければデフォルトの抽出に戻る
+        profile = self.extraction_profile
+        learner = self.extraction_learner if profile is None else None
+        # タイトルを取得（NavigableStringはツリー全体を参照しているため文字列に変換する）
+        title = profile.find_title(soup) if profile else None
+        if title is None:
+            title = soup.title.string if soup.title else "No Title"
+            if title is not None:
+                title = str(title)
+        # 日付を抽出
+        with self.metrics.stage('extract_date'):
+            date = profile.find_date(soup) if profile else None
+            if learner is not None:
+                date, date_source = self._match_date(soup)
+            elif date is None:
+                date = self.extract_date(soup)
+        # 本文コンテンツを抽出
+        with self.metrics.stage('extract_content'):
+            article_content = profile.find_content(soup) if profile else None
+            if profile:
+                self.metrics.incr('extract.profile_hit' if article_content is not None else 'extract.profile_miss')
+            if article_content is None:
+                candidates = learner.content_candidates(soup) if learner is not None else None
+                article_content = self.extract_content(soup)
+                if learner is not None:
+                    self._learn_extraction(learner.observe(candidates, article_content, date_source))
+        # HTMLをMarkdownに変換
+        with self.metrics.stage('html_to_markdown'):
+            markdown_content = self.html_to_markdown(article_content)
+        
+        return {
+            'url': url,
+            'title': title,
+            'date': date,
+            'content': markdown_content
+        }
+    
+    def _learn_extraction(self, profile):
+        """学習したプロファイルを以降のページに使い、プロファイルファイルに貼り付けられる形で表示する"""
+        if profile is None:
+            return
+        self.extraction_profile = profile
+        host = urlsplit(self.base_url).hostname or self.base_url
+        print(f"抽出プロファイルを学習しました（最初の{self.extraction_learner.pages}ページ）: "
+              f"{json.dumps({host: profile.config}, ensure_ascii=False)}")
+    
+    def parse_page(self, url, content):
+        """取得したHTMLのバイト列を解析して記事情報を返す"""
+        from bs4 import BeautifulSoup
+        with self.metrics.stage('parse'):
+            soup = BeautifulSoup(content, self.parser)
+        return self.extract_page(url, soup)
+    
+    def worker_config(self):
+        """解析ワーカープロセスでスクレイパーを作り直すための設定を返す"""
+        return {
+            'base_url': self.base_url,
+            'markdown_engine': self.markdown_engine,
+            'parser': self.parser,
+            'profile_path': self.profile_path,
+            'extraction_profiles': self.extraction_profiles,
+            'learn_extraction': self.learn_extraction,
+        }
+    
+    def _profile_call(self, func, *args):
+        """呼び出したスレッド専用のcProfileで関数を計測しながら実行する"""
+        profiler = getattr(self._profile_local, 'profiler', None)
+        if profiler is None:
+            import cProfile
+            profiler = self._profile_local.profiler = cProfile.Profile()
+            with self._lock:
+                self._profilers.append(profiler)
+        try:
+            profiler.enable()
+        except ValueError:
+            # Python 3.12以降は同時に1つのプロファイラーしか有効にできないため、計測せずに実行する
+            return func(*args)
+        try:
+            return func(*args)
+        finally:
+            profiler.disable()
+    
+    def write_profile(self):
+        """cProfileの計測結果（解析ワーカーの分を含む）を --profile のファイルに保存する"""
+        import pstats
+        path = Path(self.profile_path)
+        worker_files = sorted(path.parent.glob(path.name + '.worker*'))
+        stats = None
+        for source in self._profilers + [str(worker_file) for worker_file in worker_files]:
+            try:
+                if stats is None:
+                    stats = pstats.Stats(source, stream=sys.stdout)
+                else:
+                    stats.add(source)
+            except TypeError:
+                continue  # 一度も計測されなかったプロファイラー
+        for worker_file in worker_files:
+            worker_file.unlink()
+        if stats is None:
+            print("プロファイル: 計測結果がありません")
+            return
+        stats.dump_stats(path)
+        print(f"\nプロファイル結果を '{path}' に保存しました（累積時間の上位20件）:")
+        stats.sort_stats('cumulative').print_stats(20)
+        
+    def _fetch_sitemap(self, url, stream=False):
+        """サイトマップを取得する（ワーカースレッドで実行、stream=Trueなら本文は読まずに返す）"""
+        with self.metrics.stage('sitemap_fetch'):
+            response = self.transport.get(url, stream=stream)
+        try:
+            response.raise_for_status()
+        except Exception:
+            response.close()
+            raise
+        return response
+    
+    def _open_sitemap_stream(self, sitemap_url, content):
+        """サイトマップ本文を読み出すファイルオブジェクトを返す（.xml.gzは逐次展開する）
+        
+        content はバイト列か、本文を読んでいないストリーミングのレスポンス。レスポンスは
+        接続から読みながら解析するため、本文全体をメモリに置かない。
+        """
+        if isinstance(content, bytes):
+            raw = io.BytesIO(content)
+        else:
+            # iter_contentはContent-Encoding（gzip転送）を展開し、キャッシュの本文にも対応する
+            raw = _ChunkReader(content.iter_content(self.transport.CHUNK_SIZE))
+        stream = io.BufferedReader(raw, self.transport.CHUNK_SIZE)
+        if sitemap_url.endswith('.gz') or stream.peek(2)[:2] == b'\x1f\x8b':
+            return gzip.GzipFile(fileobj=stream)
+        return stream
+    
+    def _child_text(self, elem, name):
+        """名前空間を無視して子要素のテキストを取得する"""
+        for child in elem:
+            if child.tag.rsplit('}', 1)[-1] == name and child.text:
+                return child.text.strip()
+        return None
+    
+    def iter_xml_sitemap(self, sitemap_url, xml_content):
+        """XMLサイトマップを逐次解析してURLを1件ずつ返す（xml_contentはバイト列かストリーミングのレスポンス）"""
+        count = 0
+        child_sitemaps = []
+        is_index = False
+        
+        try:
+            # iterparseで要素ごとに処理し、処理済みの要素は破棄してメモリ使用量を抑える
+            root = None
+            for event, elem in ET.iterparse(self._open_sitemap_stream(sitemap_url, xml_content), events=('start', 'end')):
+                if event == 'start':
+                    if root is None:
+                        root = elem
+                        is_index = elem.tag.endswith('sitemapindex')
+                        if is_index:
+                            print("サイトマップインデックスを検出しました。含まれるサイトマップを処理します。")
+                    continue
+                
+                name = elem.tag.rsplit('}', 1)[-1]
+                if name == 'sitemap' and is_index:
+                    loc = self._child_text(elem, 'loc')
+                    if loc:
+                        child_sitemaps.append(loc)
+                    root.clear()
+                elif name == 'url' and not is_index:
+                    loc = self._child_text(elem, 'loc')
+                    if loc and self.is_same_site(loc):
+                        # 更新判定に使うため <lastmod> を記録する
+                        lastmod = self._child_text(elem, 'lastmod')
+                        if lastmod:
+                            self.sitemap_lastmods[loc] = lastmod
+                        count += 1
+                        yield loc
+                    root.clear()
+        except (ET.ParseError, OSError, EOFError) as e:
+            if count or child_sitemaps:
+                print(f"XMLの解析エラー: {e}（{sitemap_url} の途中までのURLを使用します）")
+            elif not isinstance(xml_content, bytes):
+                # 読みながら解析した本文は残っていないため、HTMLとしては解析し直さない
+                print(f"XMLの解析エラー: {e}（{sitemap_url} をスキップします）")
+                return
+            else:
+                print(f"XMLの解析エラー: {e}、HTMLサイトマップとして処理を試みます")
+                # 取得済みの本文をそのままHTMLとして解析する（再取得はしない）
+                from bs4 import BeautifulSoup
+                soup = BeautifulSoup(xml_content, self.parser)
+                yield from self.iter_html_sitemap(soup, sitemap_url)
+                return
+        
+        if child_sitemaps:
+            yield from self._iter_child_sitemaps(child_sitemaps)
+        elif not is_index:
+            print(f"XMLサイトマップから {count} 個のURLを抽出しました")
+    
+    def _iter_child_sitemaps(self, child_urls):
+        """子サイトマップを並列に取得し、応答が届いた順に本文を読みながら解析してURLを返す
+        
+        同時に取得する子サイトマップは max(4, concurrency) 件までとし、解析を終えたレスポンスは
+        すぐに閉じて手放す（未処理のレスポンスが本文ごと溜まらないようにする）。
+        """
+        max_pending = max(4, self.concurrency)
+        executor = ThreadPoolExecutor(max_workers=max_pending)
+        child_urls = iter(child_urls)
+        futures = {}
+        try:
+            while True:
+                # 常にmax_pending件の取得が処理中になるように補充する
+                while len(futures) < max_pending:
+                    url = next(child_urls, None)
+                    if url is None:
+                        break
+                    futures[executor.submit(self._fetch_sitemap, url, stream=True)] = url
+                if not futures:
+                    break
+                
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    url = futures.pop(future)
+                    print(f"サブサイトマップを処理: {url}")
+                    try:
+                        response = future.result()
+                    except Exception as e:
+                        print(f"サブサイトマップの処理中にエラー: {e}")
+                        continue
+                    try:
+                        yield from self.iter_xml_sitemap(url, response)
+                    finally:
+                        # ストリーミングの取得は受信したバイト数をここで記録する
+                        self.metrics.incr('http.bytes', response.raw.tell())
+                        response.close()
+        finally:
+            # 列挙が途中で打ち切られた場合は未実行の取得を取り消し、取得済みのレスポンスを閉じる
+            for future in futures:
+                if not future.cancel() and future.done() and future.exception() is None:
+                    future.result().close()
+            executor.shutdown(wait=False)
+    
+    def parse_xml_sitemap(self, sitemap_url, xml_content):
+        """XMLサイトマップを解析してURLのリストを返す"""
+        return list(self.iter_xml_sitemap(sitemap_url, xml_content))
+        
+    def _is_listing_link(self, link):
+        """カテゴリーページまたはページネーションのリンクかを判定する"""
+        return 'category' in link or '/page/' in link
+    
+    def _is_article_link(self, link):
+        """記事ページのリンクかを判定する（カテゴリではなく、ページネーションでもない）"""
+        return 'category' not in link and '/page-' not in link and '/page/' not in link
+    
+    def _fetch_listing(self, url, depth):
+        """一覧ページを取得してリンクのリストを返す（ワーカースレッドで実行、robots.txtで禁止されていれば取得しない）
+
+        解析したページ全体を結果として持ち回らないよう、ワーカースレッドでリンクだけを取り出す。
+        """
+        if not self.is_allowed(url):
+            print(f"robots.txtで禁止されているためスキップ: {url}")
+            return None
+        print(f"一覧ページから記事リンクを取得中（深さ{depth}）: {url}")
+        page_soup = self.get_soup(url)
+        if page_soup is None:
+            return None
+        return self.extract_links(page_soup, url)
+    
+    def iter_html_sitemap(self, soup, current_url):
+        """HTMLサイトマップからカテゴリー・ページネーションを幅優先でたどり、記事リンクを返す"""
+        frontier = CrawlFrontier(self.max_depth)
+        frontier.mark_seen(current_url)
+        found = 0
+        
+        def _classify(links, depth):
+            # 一覧ページは次の深さのキューへ、記事は未出のものだけを返す
+            for link in links:
+                if self._is_listing_link(link):
+                    frontier.add(link, depth + 1)
+                elif self._is_article_link(link) and frontier.mark_seen(link):
+                    yield link
+        
+        # サイトマップから直接リンクを取得
+        for link in _classify(self.extract_links(soup, current_url), 0):
+            found += 1
+            yield link
+        
+        # 一覧ページを幅優先の順に、最大 max(4, concurrency) 件ずつ並列に取得する
+        max_pending = max(4, self.concurrency)
+        executor = ThreadPoolExecutor(max_workers=max_pending)
+        futures = {}
+        try:
+            while frontier.queue or futures:
+                # 常にmax_pending件の取得が処理中になるように補充する
+                while frontier.queue and len(futures) < max_pending:
+                    url, depth = frontier.pop()
+                    futures[executor.submit(self._fetch_listing, url, depth)] = depth
+                
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    depth = futures.pop(future)
+                    links = future.result()
+                    if links is None:
+                        continue
+                    for link in _classify(links, depth):
+                        found += 1
+                        yield link
+        finally:
+            # 列挙が途中で打ち切られた場合は未実行の取得を取り消す
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+        
+        # メインページから記事が抽出できなかった場合
+        if not found and soup:
+            # 別のアプローチを試す（記事を含む要素を特定）
+            # 記事リンクのパターンを持つaタグを探す
+            article_pattern = rf'{re.escape(self.base_url)}[^/]+/[^/]+/'
+            for a_tag in soup.find_all('a', href=re.compile(article_pattern)):
+                if a_tag.get('href') and frontier.mark_seen(a_tag['href']):
+                    yield a_tag['href']
+    
+    def parse_html_sitemap(self, soup, current_url):
+        """HTMLサイトマップを解析してリンクを抽出する"""
+        return list(self.iter_html_sitemap(soup, current_url))
+    
+    def _robots_for(self, url):
+        """URLのホストのrobots.txtを解析したRobotFileParserを返す（ホストごとに1回だけ取得する）"""
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        with self._robots_lock:
+            robots = self._robots.get(origin)
+            if robots is not None:
+                return robots
+            from urllib.robotparser import RobotFileParser
+            robots = RobotFileParser(origin + '/robots.txt')
+            try:
+                response = self.transport.get(robots.url)
+                status = response.status_code
+            except Exception as e:
+                print(f"robots.txtの取得中にエラー: {e}")
+                status = None
+            if status == 200:
+                robots.parse(response.text.splitlines())
+            elif status in (401, 403):
+                robots.disallow_all = True
+            else:
+                # 存在しない・取得できない場合はすべて許可する
+                robots.allow_all = True
+            robots.modified()
+            
+            if not self.ignore_robots:
+                crawl_delay = robots.crawl_delay(self.user_agent)
+                request_rate = robots.request_rate(self.user_agent)
+                if request_rate and request_rate.requests:
+                    crawl_delay = max(float(crawl_delay or 0), request_rate.seconds / request_rate.requests)
+                if crawl_delay:
+                    print(f"robots.txtのCrawl-delayに従います: {parts.netloc}（{float(crawl_delay):g}秒間隔）")
+                    self.rate_limiter.set_crawl_delay(url, float(crawl_delay))
+            self._robots[origin] = robots
+            return robots
+    
+    def is_allowed(self, url):
+        """robots.txtでURLの取得が許可されているかを判定する（--ignore-robots なら常に許可）"""
+        if self.ignore_robots:
+            return True
+        return self._robots_for(url).can_fetch(self.user_agent, url)
+    
+    def _iter_allowed(self, links, counts):
+        """robots.txtで禁止されたURLを除外する"""
+        for link in links:
+            if self.is_allowed(link):
+                yield link
+            else:
+                counts['disallowed'] += 1
+                print(f"robots.txtで禁止されているためスキップ: {link}")
+    
+    def _robots_sitemaps(self):
+        """robots.txtの Sitemap: 行に記載されたサイトマップURLを返す"""
+        return self._robots_for(self.base_url).site_maps() or []
+    
+    def _probe_sitemaps(self, candidates):
+        """サイトマップ候補を並列に確認し、取得できた {URL: レスポンス} を返す（各URLは1回だけ取得）"""
+        candidates = list(dict.fromkeys(candidates))
+        for candidate in candidates:
+            print(f"サイトマップ候補を確認中: {candidate}")
+        
+        responses = {}
+        with ThreadPoolExecutor(max_workers=len(candidates)) as executor:
+            futures = {executor.submit(self.transport.get, candidate): candidate for candidate in candidates}
+            for future in as_completed(futures):
+                try:
+                    response = future.result()
+                except Exception as e:
+                    print(f"サイトマップ候補の確認中にエラー: {e}")
+                    continue
+                if response.status_code == 200:
+                    responses[futures[future]] = response
+        return responses
+    
+    def _iter_sitemap_response(self, sitemap_url, response):
+        """取得済みのサイトマップをXMLまたはHTMLとして解析してURLを返す"""
+        content_type = response.headers.get('Content-Type', '').lower()
+        if 'xml' in content_type or 'gzip' in content_type or sitemap_url.endswith(('.xml', '.xml.gz')):
+            print("XMLサイトマップとして処理します")
+            yield from self.iter_xml_sitemap(sitemap_url, response.content)
+        else:
+            print("HTMLサイトマップとして処理します")
+            from bs4 import BeautifulSoup
+            soup = BeautifulSoup(response.content, self.parser)
+            yield from self.iter_html_sitemap(soup, sitemap_url)
+    
+    def iter_sitemap_links(self):
+        """サイトマップからリンクを見つかった順に1件ずつ返す（重複は除く）"""
+        seen = set()
+        for link in self._iter_sitemap_sources():
+            key = url_key(link)
+            if key not in seen:
+                seen.add(key)
+                yield link
+    
+    def _iter_sitemap_sources(self):
+        """サイトマップを探索し、見つかったサイトマップのURLを順に返す"""
+        # サイトマップURLが指定されている場合はそれだけを使用する
+        if self.sitemap_url:
+            print(f"サイトマップから取得中: {self.sitemap_url}")
+            responses = self._probe_sitemaps([self.sitemap_url])
+            if self.sitemap_url in responses:
+                yield from self._iter_sitemap_response(self.sitemap_url, responses[self.sitemap_url])
+            else:
+                print(f"サイトマップを取得できませんでした: {self.sitemap_url}")
+            return
+        
+        # robots.txtにサイトマップが記載されていればすべて処理する
+        robots_sitemaps = self._robots_sitemaps()
+        if robots_sitemaps:
+            print(f"robots.txtから {len(robots_sitemaps)} 個のサイトマップを検出しました")
+            responses = self._probe_sitemaps(robots_sitemaps)
+            found = False
+            for sitemap_url in robots_sitemaps:
+                if sitemap_url in responses:
+                    found = True
+                    print(f"有効なサイトマップが見つかりました: {sitemap_url}")
+                    yield from self._iter_sitemap_response(sitemap_url, responses.pop(sitemap_url))
+            if found:
+                return
+        
+        # WordPressの一般的なサイトマップのパターンを試す
+        sitemap_candidates = [
+            urljoin(self.base_url, "sitemap.xml"),
+            urljoin(self.base_url, "sitemap_index.xml"),
+            urljoin(self.base_url, "post-sitemap.xml"),
+        ]
+        # take1bit.comの場合は特定のページもHTMLサイトマップの候補にする（最後にフォールバックとして使う）
+        if 'take1bit.com' in self.base_url:
+            sitemap_candidates += [
+                urljoin(self.base_url, "page-sitemap.xml"),
+                "https://take1bit.com/page-448/"
+            ]
+        
+        responses = self._probe_sitemaps(sitemap_candidates)
+        for candidate in sitemap_candidates:
+            if candidate in responses:
+                print(f"有効なサイトマップが見つかりました: {candidate}")
+                yield from self._iter_sitemap_response(candidate, responses[candidate])
+                return
+        
+        print("有効なサイトマップが見つかりませんでした。")
+    
+    def get_sitemap_links(self):
+        """サイトマップからリンクを取得する"""
+        return list(self.iter_sitemap_links())
+    
+    def iter_article_links(self):
+        """記事リンクを重複なく見つかった順に返す（見つからなければWordPressサイトマップも試す）"""
+        print("サイトマップからリンクを取得中...")
+        seen = set()
+        
+        def _new_links(links):
+            for link in links:
+                key = url_key(link)
+                if key not in seen:
+                    seen.add(key)
+                    # 取得したリンクを表示（最大10件）
+                    if len(seen) == 1:
+                        print("\n取得した記事リンク一覧（一部）:")
+                    if len(seen) <= 10:
+                        print(f"{len(seen)}. {link}")
+                    yield link
+        
+        yield from _new_links(self.iter_sitemap_links())
+        
+        # 記事リンクが見つからなかった場合、WordPressの他のサイトマップも試す
+        if not seen and ('wordpress' in self.base_url.lower() or self.try_wordpress_sitemaps):
+            print("WordPressサイトマップを確認します...")
+            wordpress_sitemaps = [
+                urljoin(self.base_url, "post-sitemap.xml"),
+                urljoin(self.base_url, "page-sitemap.xml"),
+                urljoin(self.base_url, "category-sitemap.xml"),
+                urljoin(self.base_url, "tag-sitemap.xml")
+            ]
+            
+            responses = self._probe_sitemaps(wordpress_sitemaps)
+            for wp_sitemap in wordpress_sitemaps:
+                response = responses.get(wp_sitemap)
+                if response is not None and ('xml' in response.headers.get('Content-Type', '').lower() or wp_sitemap.endswith('.xml')):
+                    before = len(seen)
+                    yield from _new_links(self.iter_xml_sitemap(wp_sitemap, response.content))
+                    if len(seen) > before:
+                        print(f"{wp_sitemap}から{len(seen) - before}個のリンクを取得しました")
+        
+        print(f"サイトマップから {len(seen)} 個の記事リンクを取得しました")
+    
+    def _filter_links(self, links, known, counts):
+        """新規URLとlastmodが変わったURLだけを返す"""
+        backfill = {}
+        try:
+            for link in links:
+                if link not in known:
+                    counts['new'] += 1
+                    yield link
+                    continue
+                lastmod = self.sitemap_lastmods.get(link)
+                if lastmod and known[link] and lastmod != known[link]:
+                    counts['changed'] += 1
+                    yield link
+                else:
+                    counts['skipped'] += 1
+                    self.sitemap_lastmods.pop(link, None)
+                    if lastmod and not known[link]:
+                        backfill[link] = lastmod
+        finally:
+            if backfill:
+                self.state.update_lastmods(backfill)
+    
+    def _worker_file_name(self, stem, suffix=''):
+        """ワーカーごとに分けるファイルの名前を返す（キューのワーカーでなければ従来どおりの名前）"""
+        if self.worker_id:
+            stem = f"{stem}-{re.sub(r'[^A-Za-z0-9_.-]', '_', self.worker_id)}"
+        return stem + suffix
+    
+    def create_sink(self):
+        """--output-format に応じた出力先を作成する"""
+        if self.output_format == 'jsonl':
+            return JsonlSink(self.output_dir / self._worker_file_name('articles', '.jsonl'))
+        if self.output_format == 'shards':
+            return ShardedArchiveSink(self.output_dir / 'shards', max_shard_bytes=int(self.shard_size_mb * 1024 * 1024),
+                                      prefix=self._worker_file_name('articles'))
+        return MarkdownDirSink(self, self.output_dir, layout=self.markdown_layout,
+                               manifest_name=self._worker_file_name('manifest', '.jsonl'))
+    
+    def _find_duplicate(self, url, content_hash, value):
+        """本文が同じ（または近い）保存済みページを (URL, 出力先, 距離) で返す（無ければNone）"""
+        row = self.state.find_by_hash(content_hash, exclude_url=url)
+        if row:
+            return row[0], row[1], 0
+        if self.simhash_index is not None and value is not None:
+            match = self.simhash_index.find(value, exclude_url=url)
+            if match:
+                original = self.state.get(match[0])
+                return match[0], original['output_path'] if original else None, match[1]
+        return None
+    
+    def _record_alias(self, url, original_url, output_path, distance):
+        """重複ページを元のページのエイリアスとして aliases.jsonl に追記する"""
+        if self.aliases_file is None:
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            self.aliases_file = open(self.output_dir / self._worker_file_name('aliases', '.jsonl'), 'a', encoding='utf-8')
+        alias = {'url': url, 'alias_of': original_url, 'output_path': output_path, 'distance': distance}
+        self.aliases_file.write(json.dumps(alias, ensure_ascii=False) + '\n')
+    
+    def _save_page(self, page_info):
+        """ページを出力先に書き込み、クロール状態に記録する（重複や変更のない本文は書き込まない）"""
+        content = page_info.get('content', '')
+        content_hash = hashlib.sha256(content.encode('utf-8')).hexdigest()
+        url = page_info['url']
+        # 記録したlastmodは不要になるので破棄してメモリを解放する
+        lastmod = self.sitemap_lastmods.pop(url, None)
+        
+        with self.metrics.stage('dedup'):
+            value = simhash(content) if self.simhash_index is not None else None
+            previous = self.state.get(url)
+            if lastmod is None and previous:
+                # サイトマップを読まない再抽出などでは前回のlastmodを引き継ぐ
+                lastmod = previous['lastmod']
+            # 前回と本文が同じで出力も残っていれば書き直さない
+            if (previous and previous['content_hash'] == content_hash and not previous['alias_of']
+                    and previous['output_path'] and Path(previous['output_path']).exists()):
+                self.state.record(url, lastmod=lastmod, content_hash=content_hash,
+                                  output_path=previous['output_path'], simhash=value)
+                if value is not None and previous['simhash'] is None:
+                    self.simhash_index.add(value, url)
+                self.metrics.incr('pages.unchanged')
+                print(f"変更なし: {url}")
+                return None
+            # 本文が空のページは別の記事でも同じになるため重複とはみなさない
+            duplicate = self._find_duplicate(url, content_hash, value) if content and self.duplicates != 'keep' else None
+        
+        if duplicate:
+            original_url, output_path, distance = duplicate
+            self.state.record(url, lastmod=lastmod, content_hash=content_hash, output_path=output_path,
+                              alias_of=original_url)
+            if self.duplicates == 'alias' and not (previous and previous['alias_of'] == original_url):
+                self._record_alias(url, original_url, output_path, distance)
+            self.metrics.incr('pages.duplicate' if distance == 0 else 'pages.near_duplicate')
+            kind = "重複" if distance == 0 else f"近似重複（距離 {distance}）"
+            print(f"{kind}のためスキップ: {url} -> {original_url}")
+            return None
+        
+        with self.metrics.stage('write'):
+            filepath = self.sink.write(page_info)
+        self.metrics.incr('pages.saved')
+        self.state.record(url, lastmod=lastmod, content_hash=content_hash, output_path=filepath, simhash=value)
+        if value is not None:
+            self.simhash_index.add(value, url)
+        print(f"保存完了: {filepath}")
+        return filepath
+    
+    def _import_existing_files(self):
+        """既存のMarkdownファイルのURLをクロール状態DBに取り込む（初回のみ）"""
+        print("既存のMarkdownファイルをクロール状態DBに取り込んでいます...")
+        known = {}
+        # マニフェストがあればファイルを読まずにURL・保存先・本文のハッシュを取り込む
+        for entry in MarkdownDirSink.iter_manifest(self.output_dir):
+            md_file = self.output_dir / entry['path']
+            if md_file.exists():
+                self.state.record(entry['url'], content_hash=entry['content_hash'], output_path=md_file)
+                known[entry['url']] = None
+        if known:
+            self.state.commit()
+            return known
+        # マニフェストより前に保存されたファイルは、直下とハッシュのサブディレクトリから探す
+        md_files = itertools.chain(self.output_dir.glob('*.md'), self.output_dir.glob('[0-9a-f][0-9a-f]/*.md'))
+        for md_file in md_files:
+            try:
+                with open(md_file, 'r', encoding='utf-8') as f:
+                    content = f.read()
+                url_match = re.search(r'url: (https?://[^\n]+)', content)
+                if url_match:
+                    url = url_match.group(1)
+                    body = content.split('\n---\n\n', 1)[-1]
+                    content_hash = hashlib.sha256(body.encode('utf-8')).hexdigest()
+                    self.state.record(url, content_hash=content_hash, output_path=md_file,
+                                      fetched_at=md_file.stat().st_mtime)
+                    known[url] = None
+            except Exception as e:
+                print(f"既存ファイル {md_file} の読み込みエラー: {e}")
+        self.state.commit()
+        return known
+    
+    def _fetch_and_process(self, url):
+        """ページを取得・処理する（ワーカースレッドで実行、レート制限はHttpTransportで守る）"""
+        return self.process_page(url)
+    
+    def _iter_concurrent(self, links):
+        """最大concurrency件のリクエストを同時に実行し、処理できた記事情報を返す"""
+        print(f"並列取得モード: 同時接続数 {self.concurrency}")
+        links = iter(links)
+        
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            pending = set()
+            while True:
+                # 常にconcurrency件のリクエストが処理中になるように補充する
+                while len(pending) < self.concurrency:
+                    link = next(links, None)
+                    if link is None:
+                        break
+                    pending.add(executor.submit(self._fetch_and_process, link))
+                self.metrics.gauge('queue.pending', len(pending))
+                if not pending:
+                    break
+                
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        page_info = future.result()
+                    except Exception as e:
+                        print(f"ページ処理中にエラー: {e}")
+                        continue
+                    if page_info:
+                        yield page_info
+    
+    def _fetch_for_pipeline(self, url):
+        """ページのバイト列を取得する（取得スレッドで実行）"""
+        print(f"Processing: {url}")
+        return url, self.fetch_content(url, archive=True)
+    
+    def _iter_pipeline(self, links):
+        """取得スレッドと解析プロセスを分けたパイプラインで記事を処理し、記事情報を返す"""
+        print(f"パイプラインモード: 同時接続数 {self.concurrency} / 解析プロセス数 {self.workers}")
+        links = iter(links)
+        # 解析待ちのページ数の上限（取得が解析より速い場合はここで取得を止める）
+        queue_size = self.workers * 2
+        
+        fetch_executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        # 各ワーカーでは初期化時に一度だけスクレイパーを作り直す
+        # （ワーカーは取得・進捗のスレッドが動き出した後に起動するため、ロックを引き継ぐforkは使わない）
+        start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        parse_executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_parse_worker,
+                                             initargs=(type(self), self.worker_config()),
+                                             mp_context=multiprocessing.get_context(start_method))
+        fetching = set()
+        parsing = set()
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and len(fetching) < self.concurrency and len(parsing) < queue_size:
+                    link = next(links, None)
+                    if link is None:
+                        exhausted = True
+                        break
+                    if link in self.visited_urls:
+                        continue
+                    self.visited_urls.add(link)
+                    fetching.add(fetch_executor.submit(self._fetch_for_pipeline, link))
+                self.metrics.gauge('queue.fetching', len(fetching))
+                self.metrics.gauge('queue.parsing', len(parsing))
+                if not fetching and not parsing:
+                    break
+                
+                done, _ = wait(fetching | parsing, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future in fetching:
+                        fetching.remove(future)
+                        url, content = future.result()
+                        if content is not None:
+                            parsing.add(parse_executor.submit(_parse_in_worker, url, content))
+                        continue
+                    
+                    parsing.remove(future)
+                    try:
+                        page_info, worker_metrics = future.result()
+                    except Exception as e:
+                        print(f"ページ処理中にエラー: {e}")
+                        continue
+                    self.metrics.merge(worker_metrics)
+                    yield page_info
+        finally:
+            fetch_executor.shutdown()
+            parse_executor.shutdown()
+    
+    def iter_pages(self, links):
+        """リンクを順に処理し、記事情報を1件ずつ返す（保持はしない）"""
+        if self.workers > 0:
+            yield from self._iter_pipeline(links)
+        elif self.concurrency > 1:
+            yield from self._iter_concurrent(links)
+        else:
+            for link in links:
+                # リクエストの間隔はHttpTransportのレート制限で空ける
+                page_info = self.process_page(link)
+                if page_info:
+                    yield page_info
+    
+    def write_stats(self, finished=True):
+        """計測値の集計結果を --stats のJSONファイルに書き出す（途中経過は同じファイルを上書きする）"""
+        summary = self.metrics.summary()
+        summary['finished'] = finished
+        summary['crawl'] = dict(self.crawl_counts)
+        summary['http'] = self.transport.stats()
+        summary['hosts'] = self.rate_limiter.report()
+        # 読み取り途中のファイルが見えないように一時ファイルに書いてから置き換える
+        tmp_path = self.stats_path.with_name(self.stats_path.name + '.tmp')
+        self.stats_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.stats_path)
+    
+    def _report_progress(self, stop):
+        """progress_interval秒ごとに進捗を表示し、--stats のスナップショットを更新する（別スレッドで実行）"""
+        while not stop.wait(self.progress_interval):
+            elapsed = time.time() - self.metrics.started
+            saved = self.metrics.counter('pages.saved')
+            print(f"進捗: 保存 {saved}件 / 失敗 {self.metrics.counter('pages.failed')}件 / "
+                  f"リクエスト {self.transport.request_count}件 / "
+                  f"受信 {self.metrics.counter('http.bytes') / 1024 / 1024:.1f}MB / "
+                  f"{saved / elapsed if elapsed else 0:.2f}ページ/秒 / 経過 {elapsed:.0f}秒")
+            if self.stats_path:
+                try:
+                    self.write_stats(finished=False)
+                except OSError as e:
+                    print(f"統計ファイルの書き込みに失敗しました: {e}")
+    
+    def print_rate_report(self):
+        """ホストごとの実効レート（adaptiveでは調整後の同時リクエスト数も）を表示する"""
+        for host, report in self.rate_limiter.report().items():
+            if not report['requests']:
+                continue
+            line = f"実効レート: {host} {report['rate'] or 0:.2f}リクエスト/秒（{report['requests']}件）"
+            if 'concurrency' in report:
+                line += (f" / 同時リクエスト数 {report['concurrency']}（最大 {report['peak_concurrency']}）"
+                         f" / 減速 {report['decreases']}回")
+            if report['crawl_delay']:
+                line += f" / Crawl-delay {report['crawl_delay']:g}秒"
+            print(line)
+    
+    def print_stage_summary(self):
+        """ステージごとの処理時間の集計を表示する"""
+        stages = self.metrics.summary()['stages']
+        if not stages:
+            return
+        print("ステージ別処理時間:")
+        for name, stage in stages.items():
+            print(f"  {name}: {stage['count']}件 / 平均 {stage['mean_ms']:.1f}ms / p50 {stage['p50_ms']:.1f}ms / "
+                  f"p99 {stage['p99_ms']:.1f}ms / 合計 {stage['total_ms'] / 1000:.1f}秒")
+    
+    def _open_state(self):
+        """クロール状態DBを開き、取得済みの {URL: lastmod} を返す"""
+        has_output = self.output_dir.exists()
+        # 複数のワーカーが同じDBに書き込む場合は、ロックを長く持たないよう1件ずつコミットする
+        self.state = CrawlState(self.state_db, commit_interval=1 if self.worker_id else 100)
+        known = self.state.load()
+        if not known and has_output:
+            known = self._import_existing_files()
+        return known
+    
+    def enqueue(self, queue, max_pages=None):
+        """サイトマップから新規または更新された記事のURLを列挙して共有キューに追加する"""
+        known = self._open_state()
+        counts = {'new': 0, 'changed': 0, 'skipped': 0, 'disallowed': 0}
+        links = self._filter_links(self._iter_allowed(self.iter_article_links(), counts), known, counts)
+        links_to_add = links
+        if max_pages is not None and max_pages > 0:
+            links_to_add = itertools.islice(links, max_pages)
+        added = 0
+        try:
+            while True:
+                batch = [(link, self.sitemap_lastmods.pop(link, None)) for link in itertools.islice(links_to_add, 500)]
+                if not batch:
+                    break
+                queue.add(self.base_url, batch)
+                added += len(batch)
+        finally:
+            links.close()
+            self.state.close()
+        print(f"キューに追加: {self.base_url} {added}個の記事（新規 {counts['new']}個・更新 {counts['changed']}個、"
+              f"変更のない{counts['skipped']}個は除外）")
+        return added
+    
+    def list_urls(self, out=None, max_pages=None):
+        """記事を取得せず、列挙した記事のURLとlastmodを見つかった順にタブ区切りで書き出す"""
+        out = out or sys.stdout
+        counts = {'disallowed': 0}
+        count = 0
+        links = self._iter_allowed(self.iter_article_links(), counts)
+        try:
+            # 進捗のメッセージはURLの一覧に混ざらないよう標準エラー出力に書く
+            with redirect_stdout(sys.stderr):
+                for link in links:
+                    out.write(f"{link}\t{self.sitemap_lastmods.pop(link, None) or ''}\n")
+                    count += 1
+                    if max_pages and count >= max_pages:
+                        break
+            out.flush()
+        except BrokenPipeError:
+            # head などで読み手が先に終了した場合は、終了時のフラッシュでも失敗しないよう以降の出力を捨てる
+            os.dup2(os.open(os.devnull, os.O_WRONLY), out.fileno())
+        finally:
+            links.close()
+        print(f"{count}個の記事のURLを列挙しました（robots.txtで禁止された{counts['disallowed']}個は除外）", file=sys.stderr)
+        return count
+    
+    def _iter_leased(self, queue, batch_size, counts):
+        """共有キューからこのサイトのURLをリースして返す（robots.txtで禁止されたURLは処理済みにする）"""
+        if not self.ignore_robots:
+            # 取得を始める前にrobots.txtを読み込み、Crawl-delayをレート制限に反映する
+            self._robots_for(self.base_url)
+        while True:
+            items = queue.lease(self.worker_id, self.base_url, batch_size)
+            if not items:
+                return
+            for url, lastmod in items:
+                # キューへの追加後にrobots.txtが変わっている場合もあるため、取得の直前に確認する
+                if not self.is_allowed(url):
+                    counts['disallowed'] += 1
+                    print(f"robots.txtで禁止されているためスキップ: {url}")
+                    queue.complete(self.worker_id, url)
+                    continue
+                if lastmod:
+                    self.sitemap_lastmods[url] = lastmod
+                # 同じプロセスでの再試行でも処理されるよう、処理済みの記録から外す
+                self.visited_urls.discard(url)
+                yield url
+    
+    def run(self, max_pages=None, queue=None):
+        """スクレイピングを実行する（queueを渡すと共有キューからリースしたURLを処理する）"""
+        # クロール状態DBから取得済みURLを読み込む
+        known = self._open_state()
+        
+        # サイトマップの列挙と並行して、新規または更新されたURLから順に処理する
+        counts = {'new': 0, 'changed': 0, 'skipped': 0, 'disallowed': 0}
+        self.crawl_counts = counts
+        if queue is not None:
+            # 取得中のURLより少し多めにリースする（リースの期限内に処理を終えられる量に抑える）
+            print(f"キューから取得: {self.base_url}（ワーカー {self.worker_id}）")
+            links = self._iter_leased(queue, batch_size=max(self.concurrency, self.workers) * 2, counts=counts)
+        elif self.from_archive:
+            # アーカイブのページをすべて再抽出する（本文が変わらなかった記事は書き直さない）
+            print(f"アーカイブ '{self.archive.archive_dir}' の{self.archive.count()}ページを再抽出します"
+                  f"（ネットワークには接続しません、解析プロセス数 {self.workers}）")
+            links = self.archive.iter_urls()
+        else:
+            links = self._filter_links(self._iter_allowed(self.iter_article_links(), counts), known, counts)
+        links_to_process = links
+        
+        # 最大ページ数の制限がある場合
+        if max_pages is not None and max_pages > 0:
+            links_to_process = itertools.islice(links, max_pages)
+        
+        # 近似重複の検出には保存済みページのSimHashを読み込んでおく
+        self.simhash_index = None
+        if self.near_duplicates:
+            self.simhash_index = SimHashIndex(self.near_duplicate_distance)
+            for url, value in self.state.load_simhashes():
+                self.simhash_index.add(value, url)
+        
+        # 記事は1件ずつ出力先に書き込み、メモリには保持しない（書き込みはメインスレッドで行う）
+        self.sink = self.create_sink()
+        self.aliases_file = None
+        processed_count = 0
+        pages = self.iter_pages(links_to_process)
+        # 定期的な進捗表示（--progress-interval 0 で無効）
+        stop_progress = threading.Event()
+        if self.progress_interval and self.progress_interval > 0:
+            threading.Thread(target=self._report_progress, args=(stop_progress,), daemon=True).start()
+        try:
+            for page_info in pages:
+                if self._save_page(page_info):
+                    processed_count += 1
+                if queue is not None:
+                    queue.complete(self.worker_id, page_info['url'])
+        finally:
+            # 途中で打ち切った場合も取得と列挙を終了させる
+            stop_progress.set()
+            pages.close()
+            links.close()
+            self.sink.close()
+            if self.aliases_file is not None:
+                self.aliases_file.close()
+            if self.archive is not None:
+                self.archive.close()
+            self.state.close()
+            if queue is not None:
+                # 取得に失敗したURLは再試行できるようキューに戻す
+                queue.release(self.worker_id)
+        
+        if queue is None and not self.from_archive:
+            print(f"\n処理対象: {counts['new'] + counts['changed']}個の記事（新規 {counts['new']}個・"
+                  f"更新 {counts['changed']}個、変更のない{counts['skipped']}個は除外）")
+            if counts['disallowed']:
+                print(f"robots.txtで禁止された{counts['disallowed']}個の記事は取得しませんでした")
+        
+        print(f"\nスクレイピング完了! {processed_count}個の記事を保存しました。")
+        duplicates = self.metrics.counter('pages.duplicate') + self.metrics.counter('pages.near_duplicate')
+        unchanged = self.metrics.counter('pages.unchanged')
+        if duplicates or unchanged:
+            print(f"重複のため保存しなかった記事: {duplicates}個（うち近似重複 {self.metrics.counter('pages.near_duplicate')}個）/ "
+                  f"本文に変更がなく書き込みを省略した記事: {unchanged}個")
+        print(f"記事ファイルは '{self.output_dir}' ディレクトリに保存されています。")
+        
+        stats = self.transport.stats()
+        print(f"HTTP統計: リクエスト {stats['requests']}件 / 新規接続 {stats['connections_opened']}件 / "
+              f"接続再利用 {stats['connections_reused']}件 / リトライ {stats['retries']}件")
+        if self.transport.cache:
+            print(f"キャッシュ統計: 304で再利用 {stats['cache_hits']}件 / "
+                  f"節約した転送量 {stats['cache_bytes_saved'] / 1024:.1f}KB")
+        self.print_rate_report()
+        self.print_stage_summary()
+        
+        if self.stats_path:
+            self.write_stats(finished=True)
+            print(f"統計情報を '{self.stats_path}' に保存しました")
+        if self.profile_path:
+            self.write_profile()
+
+
+# 解析ワーカープロセスごとのスクレイパー（_init_parse_worker で一度だけ作成する）
+_worker_scraper = None
+_worker_cpu_ms = (0, 0)  # 前回計測したワーカーのCPU時間（user, system、ミリ秒）
+
+
+def _init_parse_worker(scraper_class, config):
+    """解析ワーカープロセスの初期化処理"""
+    global _worker_scraper
+    _worker_scraper = scraper_class(**config)
+    if _worker_scraper.profile_path:
+        # ワーカー終了時に計測結果をファイルに保存する（親プロセスが --profile のファイルにまとめる）
+        multiprocessing.util.Finalize(None, _dump_worker_profile, exitpriority=10)
+
+
+def _dump_worker_profile():
+    profile_path = f"{_worker_scraper.profile_path}.worker{os.getpid()}"
+    for profiler in _worker_scraper._profilers:
+        profiler.dump_stats(profile_path)
+
+
+def _record_worker_usage(metrics):
+    """前回からのワーカーのCPU時間と最大常駐メモリを計測値に加える
+
+    forkserver・spawnで起動したワーカーは親プロセスの子として集計されないことがある
+    （RUSAGE_CHILDREN・os.times() に現れない）ため、ワーカー自身が計測して親へ送る。
+    """
+    global _worker_cpu_ms
+    try:
+        import resource
+    except ImportError:
+        return  # Windowsでは計測しない
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    user, system = _worker_cpu_ms
+    _worker_cpu_ms = (round(usage.ru_utime * 1000), round(usage.ru_stime * 1000))
+    metrics.incr('workers.cpu_user_ms', _worker_cpu_ms[0] - user)
+    metrics.incr('workers.cpu_system_ms', _worker_cpu_ms[1] - system)
+    # macOSはバイト、Linuxはキロバイト
+    metrics.gauge('workers.max_rss_kb', usage.ru_maxrss // 1024 if sys.platform == 'darwin' else usage.ru_maxrss)
+
+
+def _parse_in_worker(url, content):
+    """解析ワーカープロセスでページを解析・変換し、記事情報とこのページの計測値を返す"""
+    if _worker_scraper.profile_path:
+        page_info = _worker_scraper._profile_call(_worker_scraper.parse_page, url, content)
+    else:
+        page_info = _worker_scraper.parse_page(url, content)
+    _record_worker_usage(_worker_scraper.metrics)
+    return page_info, _worker_scraper.metrics.drain()
+
+
+def site_output_dir(base_url):
+    """複数サイトをまとめて処理するときの、サイトごとの出力先ディレクトリ名を返す"""
+    parts = urlsplit(base_url)
+    name = (parts.hostname or 'site') + (f"_{parts.port}" if parts.port else '') + parts.path.rstrip('/')
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', name)
+
+
+def crawl_queue(queue, output_dir, options, worker_id, scraper_class=WebsiteScraper):
+    """共有キューにリースできるURLがなくなるまで、サイトごとにスクレイパーを作って処理する"""
+    output_dir = Path(output_dir)
+    while True:
+        available = queue.available_sites()
+        if not available:
+            break
+        site_dirs = dict(queue.sites())
+        for base_url in sorted(available):
+            scraper = scraper_class(base_url=base_url, output_dir=output_dir / (site_dirs.get(base_url) or ''),
+                                    worker_id=worker_id, **options)
+            scraper.run(queue=queue)
+    
+    counts = queue.counts()
+    print(f"\nキューの状態: 完了 {counts.get('done', 0)}件 / 未処理 {counts.get('pending', 0)}件 / "
+          f"他のワーカーが処理中 {counts.get('leased', 0)}件 / 失敗 {counts.get('failed', 0)}件")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ウェブサイトの記事をスクレイピングしてMarkdownに変換')
+    parser.add_argument('--url', help='スクレイピング対象のベースURL（--sites・--from-archive 以外では必須）')
+    parser.add_argument('--sites', help='複数サイトをまとめて処理する場合の、ベースURLを1行に1つ書いたファイル')
+    parser.add_argument('--output-dir', default='scraped_articles', help='出力先ディレクトリ（デフォルト: scraped_articles）')
+    parser.add_argument('--delay', type=float, default=1, help='リクエスト間の遅延秒数（デフォルト: 1）')
+    parser.add_argument('--max-pages', type=int, help='最大取得ページ数（デフォルト: 無制限）')
+    parser.add_argument('--sitemap', help='サイトマップページのURL（省略可能）')
+    parser.add_argument('--wordpress', action='store_true', help='WordPressサイトマップを試行する（デフォルト: False）')
+    parser.add_argument('--concurrency', type=int, default=1, help='記事取得の同時リクエスト数（デフォルト: 1）')
+    parser.add_argument('--rate', type=float, help='並列取得時のホストあたりの最大リクエスト数/秒（デフォルト: 1/--delay）')
+    parser.add_argument('--timeout', type=float, default=30, help='HTTPリクエストのタイムアウト秒数（デフォルト: 30）')
+    parser.add_argument('--retries', type=int, default=3, help='429/5xx・接続エラー時の最大リトライ回数（デフォルト: 3）')
+    parser.add_argument('--cache-dir', help='HTTPキャッシュの保存先ディレクトリ（指定時のみ有効）')
+    parser.add_argument('--cache-size', type=float, default=1024, help='HTTPキャッシュの最大サイズMB（デフォルト: 1024）')
+    parser.add_argument('--state-db', help='クロール状態DBのパス（デフォルト: <output-dir>/.crawl_state.sqlite3）')
+    parser.add_argument('--markdown-engine', choices=['html2text', 'dom'], default='html2text',
+                        help='Markdown変換方式（dom: 解析済みツリーを直接変換、デフォルト: html2text）')
+    parser.add_argument('--parser', choices=['html.parser', 'lxml'], default='html.parser',
+                        help='HTMLパーサー（lxmlはインストールされている場合のみ、デフォルト: html.parser）')
+    parser.add_argument('--output-format', choices=['markdown', 'jsonl', 'shards'], default='markdown',
+                        help='出力形式（markdown: 記事ごとのファイル、jsonl: 1つのJSON Linesファイル、'
+                             'shards: gzip圧縮したJSON Linesのシャード、デフォルト: markdown）')
+    parser.add_argument('--max-page-size', type=float, default=10,
+                        help='ページの本文の上限MB。超えたページは読み込みを打ち切ってスキップする（0で無制限、デフォルト: 10）')
+    parser.add_argument('--head-check', action='store_true',
+                        help='.pdf・.zip・画像などの拡張子のURLは、GETの前にHEADでContent-Typeとサイズを確認する')
+    parser.add_argument('--markdown-layout', choices=['flat', 'sharded'], default='flat',
+                        help='Markdownファイルの配置（flat: 出力先の直下、sharded: URLのハッシュの先頭2文字の'
+                             'サブディレクトリ、デフォルト: flat）')
+    parser.add_argument('--shard-size', type=float, default=64, help='シャード1つあたりの最大サイズMB（デフォルト: 64）')
+    parser.add_argument('--max-depth', type=int, default=2,
+                        help='HTMLサイトマップでカテゴリー・ページネーションをたどる深さ（デフォルト: 2）')
+    parser.add_argument('--workers', type=int,
+                        help='解析・Markdown変換を行うプロセス数（0なら取得と同じスレッドで処理、'
+                             'デフォルト: 0、--from-archive ではCPUコア数）')
+    parser.add_argument('--duplicates', choices=['alias', 'skip', 'keep'], default='alias',
+                        help='本文が同じページの扱い（alias: 保存せずaliases.jsonlに記録、skip: 保存しない、'
+                             'keep: すべて保存、デフォルト: alias）')
+    parser.add_argument('--near-duplicates', action='store_true',
+                        help='SimHashで本文がほぼ同じページも重複として扱う（デフォルト: False）')
+    parser.add_argument('--near-duplicate-distance', type=int, default=3,
+                        help='近似重複とみなすSimHashのハミング距離の上限（デフォルト: 3）')
+    parser.add_argument('--extraction-profiles',
+                        help='サイトごとの抽出プロファイル（本文・除去する要素・日付・タイトルのセレクター）を定義したJSONファイル')
+    parser.add_argument('--learn-extraction', type=int, default=0,
+                        help='プロファイルが無いサイトで、最初のNページから本文と日付のセレクターを学習して以降に使う'
+                             '（0で無効、デフォルト: 0）')
+    parser.add_argument('--archive-dir', help='取得したHTMLを圧縮したWARC形式で追記保存するディレクトリ')
+    parser.add_argument('--from-archive', action='store_true',
+                        help='ネットワークに接続せず、--archive-dir のHTMLから抽出・Markdown変換をやり直す')
+    parser.add_argument('--adaptive', action='store_true',
+                        help='応答時間と429/503に応じてホストごとの同時リクエスト数を1〜--concurrencyの範囲で自動調整する'
+                             '（--delay は使わず、--rate は指定時のみ上限として守る）')
+    parser.add_argument('--ignore-robots', action='store_true',
+                        help='robots.txtのDisallowとCrawl-delayを無視する（デフォルト: False）')
+    parser.add_argument('--list-urls', action='store_true',
+                        help='記事を取得せず、列挙した記事のURLとlastmodをタブ区切りで標準出力に書き出す')
+    parser.add_argument('--queue', help='複数のワーカーで共有する作業キューのSQLiteファイル'
+                                        '（--sites 指定時のデフォルト: <output-dir>/.work_queue.sqlite3）')
+    parser.add_argument('--queue-role', choices=['all', 'enqueue', 'work'], default='all',
+                        help='キューでの役割（enqueue: URLを列挙して追加、work: キューのURLを処理、all: 両方、デフォルト: all）')
+    parser.add_argument('--lease-seconds', type=float, default=300,
+                        help='キューからリースしたURLを他のワーカーが取り直すまでの秒数（デフォルト: 300）')
+    parser.add_argument('--worker-id', help='キューのワーカーの識別子（デフォルト: <ホスト名>-<プロセスID>）')
+    parser.add_argument('--stats', help='ステージ別の処理時間・HTTP統計などをJSONで保存するファイル（実行中も定期的に更新）')
+    parser.add_argument('--progress-interval', type=float, default=30,
+                        help='進捗を表示する間隔の秒数（0で無効、デフォルト: 30）')
+    parser.add_argument('--profile', help='ページ処理をcProfileで計測し、結果（pstats形式）を保存するファイル')
+    
+    args = parser.parse_args()
+    if args.from_archive and not args.archive_dir:
+        parser.error('--from-archive には --archive-dir の指定が必要です')
+    queue_path = args.queue or (Path(args.output_dir) / '.work_queue.sqlite3' if args.sites else None)
+    if not args.url and not args.sites and not args.from_archive and not (queue_path and args.queue_role == 'work'):
+        parser.error('--url の指定が必要です')
+    if args.list_urls and not args.url:
+        parser.error('--list-urls には --url の指定が必要です')
+    
+    options = dict(
+        delay=args.delay,
+        sitemap_url=args.sitemap,
+        try_wordpress_sitemaps=args.wordpress,
+        concurrency=args.concurrency,
+        rate=args.rate,
+        timeout=args.timeout,
+        max_retries=args.retries,
+        cache_dir=args.cache_dir,
+        cache_size_mb=args.cache_size,
+        state_db=args.state_db,
+        markdown_engine=args.markdown_engine,
+        parser=args.parser,
+        workers=args.workers,
+        output_format=args.output_format,
+        shard_size_mb=args.shard_size,
+        markdown_layout=args.markdown_layout,
+        max_page_size_mb=args.max_page_size,
+        head_check=args.head_check,
+        max_depth=args.max_depth,
+        stats_path=args.stats,
+        progress_interval=args.progress_interval,
+        profile_path=args.profile,
+        duplicates=args.duplicates,
+        near_duplicates=args.near_duplicates,
+        near_duplicate_distance=args.near_duplicate_distance,
+        extraction_profiles=args.extraction_profiles,
+        learn_extraction=args.learn_extraction,
+        archive_dir=args.archive_dir,
+        from_archive=args.from_archive,
+        adaptive=args.adaptive,
+        ignore_robots=args.ignore_robots
+    )
+    
+    if args.list_urls:
+        scraper = WebsiteScraper(base_url=args.url, output_dir=args.output_dir, **options)
+        scraper.list_urls(max_pages=args.max_pages)
+        return
+    
+    if queue_path:
+        sites = [args.url] if args.url else []
+        if args.sites:
+            with open(args.sites, 'r', encoding='utf-8') as f:
+                sites.extend(line.strip() for line in f if line.strip() and not line.startswith('#'))
+        # 複数サイトの結果は1つの出力先の下にサイトごとのディレクトリとしてまとめる
+        multi_site = bool(args.sites) or len(sites) > 1
+        worker_id = args.worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        queue = WorkQueue(queue_path, lease_seconds=args.lease_seconds)
+        try:
+            if args.queue_role in ('all', 'enqueue'):
+                for base_url in sites:
+                    site_dir = site_output_dir(base_url) if multi_site else ''
+                    queue.add_site(base_url, site_dir)
+                    scraper = WebsiteScraper(base_url=base_url, output_dir=Path(args.output_dir) / site_dir, **options)
+                    scraper.enqueue(queue, max_pages=args.max_pages)
+            if args.queue_role in ('all', 'work'):
+                crawl_queue(queue, args.output_dir, options, worker_id)
+        finally:
+            queue.close()
+        return
+    
+    scraper = WebsiteScraper(base_url=args.url or '', output_dir=args.output_dir, **options)
+    scraper.run(max_pages=args.max_pages)
+
+
+if __name__ == "__main__":
     main()
\ No newline at end of file